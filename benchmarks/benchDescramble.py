@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#-----------------------------------------------------------------------------
+# Title      : Descrambler benchmark and golden output check
+#-----------------------------------------------------------------------------
+# Description:
+# Feeds synthetic raw payloads to every receiver in ePixViewer.asics through a
+# local fake frame (no hardware or rogue server needed), reports descramble
+# throughput per ASIC and checks each descrambled image against the golden
+# digest stored in descrambleGolden.json.
+#
+# Usage: python benchmarks/benchDescramble.py [--seconds 1.0] [--batch 16]
+#                                             [--asic NAME ...] [--update]
+#
+# --update rewrites the golden digests from the current implementation; only
+# use it for intended output changes.
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import importlib
+import pkgutil
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'python'))
+import ePixViewer.asics
+from ePixViewer import DataReceiverBase
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'descrambleGolden.json')
+
+# Raw input of each receiver: ('frame', payload bytes) for rogue frames, ('bytes', payload bytes)
+# for receivers reading a plain buffer and ('quadrants', (quadrants, bytes)) for receivers taking
+# one row per quadrant
+PAYLOADS = {
+    'DataReceiverAdc32x32':          ('quadrants', (2, 4 + 2 * 32 * 32)),
+    'DataReceiverCpix2':             ('quadrants', (4, 4 + 2 * 48 * 48)),
+    'DataReceiverCryo64xN':          ('frame',     2 * (6 + 64 * 100)),
+    'DataReceiverEpix100a':          ('frame',     32 + 708 * 1536),
+    'DataReceiverEpix100p':          ('frame',     32 + 706 * 1536),
+    'DataReceiverEpixHr10k2M':       ('frame',     2 * 110640),
+    'DataReceiverEpixHrDuo10kT':     ('frame',     2 * 144 * 384),
+    'DataReceiverEpixHrEpixM':       ('bytes',     2 * (6 + 64 * 64)),
+    'DataReceiverEpixHrMv2':         ('frame',     2 * 73752),
+    'DataReceiverEpixHrSingle10kT':  ('frame',     2 * 28040),
+    'DataReceiverEpixM32Array':      ('quadrants', (2, 4 + 2 * 64 * 32)),
+    'DataReceiverEpixUHRMHzMode':    ('frame',     5416 + 8),
+    'DataReceiverEpixUHR':           ('frame',     48424 + 8),
+    'DataReceiverSparkPixRt':        ('frame',     3490 + 4),
+    'DataReceiverTixel48x48':        ('quadrants', (4, 4 + 2 * 48 * 48)),
+}
+
+class FakeFrame(object):
+    """Local stand-in for a rogue frame; like rogue, getNumpy returns a copy of the payload"""
+    def __init__(self, payload):
+        self._payload = payload
+
+    def getPayload(self):
+        return self._payload.size
+
+    def getNumpy(self, offset=0, count=None):
+        if count is None:
+            count = self._payload.size - offset
+        return self._payload[offset:offset + count].copy()
+
+def receiverClasses(names=None):
+    for module in pkgutil.iter_modules(ePixViewer.asics.__path__):
+        if module.name.startswith('_'):
+            continue
+        mod = importlib.import_module('ePixViewer.asics.' + module.name)
+        for name, cls in sorted(vars(mod).items()):
+            if isinstance(cls, type) and issubclass(cls, DataReceiverBase) and cls is not DataReceiverBase and cls.__module__ == mod.__name__:
+                if names is None or name in names or module.name in names:
+                    yield name, cls
+
+def syntheticPayloads(name, count):
+    # Bit generator output is stable across NumPy versions, so the payloads (and thus the golden
+    # digests) are reproducible
+    kind, size = PAYLOADS[name]
+    shape = (count,) + (size if kind == 'quadrants' else (size,))
+    raw = np.random.PCG64(zlib.crc32(name.encode())).random_raw((int(np.prod(shape)) + 7) // 8)
+    return kind, raw.view(np.uint8)[:int(np.prod(shape))].reshape(shape)
+
+def descrambleOne(receiver, kind, payload):
+    if kind == 'frame':
+        return receiver.descramble(FakeFrame(payload))
+    elif kind == 'bytes':
+        return receiver.descramble(payload.tobytes())
+    return receiver.descramble(payload)
+
+def digest(images):
+    images = np.ascontiguousarray(images)
+    return {
+        'shape': list(images.shape),
+        'dtype': images.dtype.str,
+        'sha256': hashlib.sha256(images.tobytes()).hexdigest(),
+    }
+
+def timeRate(func, seconds):
+    func()
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser('Descrambler benchmark')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent on each measurement')
+    parser.add_argument('--batch', type=int, default=16, help='Frames per descrambleBatch call')
+    parser.add_argument('--asic', nargs='*', default=None, help='Receiver classes or asics modules to run (default: all)')
+    parser.add_argument('--update', action='store_true', help='Rewrite the golden digests')
+    args = parser.parse_args()
+
+    golden = {}
+    if os.path.exists(GOLDEN_FILE):
+        with open(GOLDEN_FILE) as f:
+            golden = json.load(f)
+
+    failed = []
+    print(f"{'receiver':<30}{'frames/s':>12}{'MB/s':>10}{'loop frames/s':>15}{'batch frames/s':>16}  golden")
+    for name, cls in receiverClasses(args.asic):
+        if name not in PAYLOADS:
+            print(f"{name:<30}  no synthetic payload defined, skipped")
+            continue
+        receiver = cls(name=name)
+        kind, payloads = syntheticPayloads(name, args.batch)
+
+        images = np.stack([np.array(descrambleOne(receiver, kind, payload)) for payload in payloads])
+        result = digest(images)
+        if args.update:
+            golden[name] = result
+            status = 'updated'
+        elif name not in golden:
+            status = 'missing'
+            failed.append(name)
+        elif golden[name] != result:
+            status = 'MISMATCH'
+            failed.append(name)
+        else:
+            status = 'ok'
+        if not np.array_equal(receiver.descrambleBatch(payloads), images):
+            status += ', batch MISMATCH'
+            failed.append(name)
+
+        frameRate = timeRate(lambda: descrambleOne(receiver, kind, payloads[0]), args.seconds)
+        # The loop keeps every image, like the batch does, so it is what descrambleBatch replaces
+        loopRate = timeRate(lambda: np.stack([np.array(descrambleOne(receiver, kind, payload)) for payload in payloads]), args.seconds) * len(payloads)
+        batchRate = timeRate(lambda: receiver.descrambleBatch(payloads), args.seconds) * len(payloads)
+        megaBytes = frameRate * payloads[0].nbytes / 1e6
+        print(f"{name:<30}{frameRate:>12.0f}{megaBytes:>10.1f}{loopRate:>15.0f}{batchRate:>16.0f}  {status}")
+
+    if args.update:
+        with open(GOLDEN_FILE, 'w') as f:
+            json.dump(golden, f, indent=4, sort_keys=True)
+            f.write('\n')
+    elif failed:
+        print("Descramble output differs from golden for: {}".format(', '.join(sorted(set(failed)))))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
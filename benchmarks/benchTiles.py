@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#-----------------------------------------------------------------------------
+# Title      : Tile-parallel descramble scaling benchmark
+#-----------------------------------------------------------------------------
+# Description:
+# Measures the descramble rate of the receivers declaring TileRows for 1 to N
+# DescrambleWorkers threads, on the synthetic payloads of benchDescramble.py,
+# and checks every worker count gives the same image as the serial path.
+#
+# Usage: python benchmarks/benchTiles.py [--seconds 1.0] [--workers N]
+#                                        [--asic NAME ...]
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import os
+import sys
+import argparse
+import numpy as np
+
+from benchDescramble import FakeFrame, receiverClasses, syntheticPayloads, timeRate
+
+def main():
+    parser = argparse.ArgumentParser('Tile-parallel descramble benchmark')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent on each measurement')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Largest number of workers measured')
+    parser.add_argument('--asic', nargs='*', default=None, help='Receiver classes or asics modules to run (default: all with TileRows)')
+    args = parser.parse_args()
+
+    failed = []
+    print(f"{'receiver':<30}{'workers':>8}{'frames/s':>12}{'speedup':>10}")
+    for name, cls in receiverClasses(args.asic):
+        if cls.TileRows is None:
+            continue
+        receiver = cls(name=name)
+        kind, payloads = syntheticPayloads(name, 1)
+        frame = FakeFrame(payloads[0])
+
+        receiver.DescrambleWorkers.set(1)
+        reference = np.array(receiver.descramble(frame))
+        serialRate = None
+        for workers in range(1, max(args.workers, 1) + 1):
+            receiver.DescrambleWorkers.set(workers)
+            if not np.array_equal(receiver.descramble(frame), reference):
+                failed.append(name)
+            rate = timeRate(lambda: receiver.descramble(frame), args.seconds)
+            serialRate = serialRate or rate
+            print(f"{name:<30}{workers:>8}{rate:>12.0f}{rate / serialRate:>9.2f}x")
+
+    if failed:
+        print("Tiled descramble differs from the serial one for: {}".format(', '.join(sorted(set(failed)))))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#-----------------------------------------------------------------------------
+# Title      : Micro-benchmark for the packed 12-bit unpacking kernel
+#-----------------------------------------------------------------------------
+# Description:
+# Compares unpackUint12 against the former per-column read_uint12 loop for the
+# payload geometries of the ePixUhr, sparkPixRt and ePixUHRMHzMode receivers,
+# checking both give the same samples.
+#
+# Usage: python benchmarks/benchUnpack12.py [--seconds 1.0]
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'python'))
+from ePixViewer.asics._descrambleTools import unpackUint12
+
+# (receiver, columns per frame, bytes per column word)
+GEOMETRIES = [
+    ('ePixUhr',        2017, 24),
+    ('sparkPixRt',      579,  6),
+    ('ePixUHRMHzMode',  225, 24),
+]
+
+def read_uint12(data_chunk):
+    # Former per-column kernel, kept as the reference
+    fst_uint8, mid_uint8, lst_uint8 = np.reshape(data_chunk, (data_chunk.shape[0] // 3, 3)).astype(np.uint16).T
+    fst_uint12 = (fst_uint8 << 4) + (mid_uint8 >> 4)
+    snd_uint12 = ((mid_uint8 % 16) << 8) + lst_uint8
+    return np.reshape(np.concatenate((fst_uint12[:, None], snd_uint12[:, None]), axis=1), 2 * fst_uint12.shape[0])
+
+def unpackPerColumn(packed, columns, wordBytes):
+    rawData_8bit = np.flip(np.reshape(packed, (columns, wordBytes)), 1).T
+    rawData_12bit = np.empty((wordBytes * 2 // 3, columns), dtype=int)
+    for j in range(columns):
+        rawData_12bit[:, j] = read_uint12(rawData_8bit[:, j])
+    return rawData_12bit
+
+def timePerCall(func, seconds):
+    func()
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func()
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+def main():
+    parser = argparse.ArgumentParser('12-bit unpack micro-benchmark')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent on each measurement')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'receiver':<16}{'per column (us)':>18}{'unpackUint12 (us)':>20}{'speedup':>10}")
+    for name, columns, wordBytes in GEOMETRIES:
+        packed = rng.integers(0, 256, columns * wordBytes, dtype=np.uint8)
+        out = np.empty((columns, wordBytes * 2 // 3), dtype=np.uint16)
+
+        if not np.array_equal(unpackPerColumn(packed, columns, wordBytes).T, unpackUint12(packed, wordBytes, out=out)):
+            raise Exception(f"{name}: unpackUint12 does not match the per-column kernel")
+
+        old = timePerCall(lambda: unpackPerColumn(packed, columns, wordBytes), args.seconds)
+        new = timePerCall(lambda: unpackUint12(packed, wordBytes, out=out), args.seconds)
+        print(f"{name:<16}{old * 1e6:>18.1f}{new * 1e6:>20.1f}{old / new:>9.0f}x")
+
+if __name__ == "__main__":
+    main()
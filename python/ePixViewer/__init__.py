@@ -5,3 +5,4 @@ from ePixViewer.ePixGUIEnvScope import *
 from ePixViewer._envDataReceiver import *
 from ePixViewer._scopeDataReceiver import *
 from ePixViewer._dataReceiver import *
+from ePixViewer._processReceiver import *
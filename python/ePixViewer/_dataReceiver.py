@@ -25,36 +25,107 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 
 import pyrogue as pr
 import numpy as np
-import sys
+import os
 import collections
 import time
-from copy import copy
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from ePixViewer._ringBuffer import RingBuffer
+from ePixViewer._sharedImageRing import SharedImageRing
+from ePixViewer._imageCodec import encodeImage
+from ePixViewer._latencyStats import LatencyHistogram
+from ePixViewer._pixelStats import RunningPixelStats, WindowedPixelStats, ExponentialPixelStats, AutoContrast, RollingHistogram
+
+# Binning factor of the binned PublishMode values
+BinFactors = {1: 2, 2: 4, 3: 8}
+
+# Timed stages of the frame processing; Publish is the flush of the variable updates at the
+# end of the update group, Total the whole frame
+LatencyStages = ('Descramble', 'Dark', 'Image', 'Noise', 'Pixel', 'Histogram', 'AutoContrast', 'Publish', 'Total')
+
+class PayloadFrame(object):
+    """Minimal stand-in for a rogue frame around a raw payload array, so descramble
+    can run on data that does not come from a stream (offline analysis, replay)"""
+    def __init__(self, payload):
+        self._payload = np.ascontiguousarray(payload).view(np.uint8).reshape(-1)
+
+    def getPayload(self):
+        return self._payload.size
+
+    def getNumpy(self, offset=0, count=None):
+        if count is None:
+            count = self._payload.size - offset
+        return self._payload[offset:offset + count]
 
 class DataReceiverBase(pr.DataReceiver):
+    # Pixel type contract: descramble returns raw images as RawPixelType, and dark corrected
+    # images are computed once, straight from the raw image, as CorrectedPixelType
+    RawPixelType = np.uint16
+    CorrectedPixelType = np.float32
+    # Descramblers gathering their image with _takeTiles declare the height of their independent
+    # row tiles (an ASIC, bank or row block); the tiles then run on DescrambleWorkers threads
+    TileRows = None
+
     def __init__(self, length, width, **kwargs):
         super().__init__(**kwargs)
         self.length = length
         self.width = width
-        self.Queue = collections.deque(maxlen = 50000)
-        # Queue for histogram
-        self.ImageQueue = collections.deque(maxlen = 30)
-        # Queue for automatic contrast
-        self.NoiseQueue = collections.deque(maxlen = 1000)
-        # Queue for noise color map
-        self.TimePlotQueue = collections.deque(maxlen = 1000)
-        # Queue for pixel timeplot y
-        self.TimePlotIndexQueue = collections.deque(maxlen = 1000)
-        # Queue for pixel timeplot x
+        self.histogram = RollingHistogram(50000)
+        # Rolling histogram of the selected pixel
+        self.histRange = None
+        # Bin range last published
+        self.autoCon = False
+        self.autoConMode = 0
+        self.autoContrast = AutoContrast(30)
+        # Running window statistics for automatic contrast
+        self.TimePlotBuffer = RingBuffer(1000, dtype=np.int64)
+        # Ring buffer for pixel timeplot y
+        self.TimePlotIndexBuffer = RingBuffer(1000, dtype=np.int64)
+        # Ring buffer for pixel timeplot x
         self.nextIndex = 0
         # Next index for timeplot
         self.maxlen = 1000
         # Maxlen for timeplot
+        self.noiseMode = 0
+        self.noiseWindow = 1000
+        self.noiseStats = WindowedPixelStats(self.noiseWindow)
+        # Running per-pixel statistics for noise color map
         self.numDarkCol = 0
-        self.DarkImg = []
+        self.darkStats = RunningPixelStats()
+        # Streaming accumulator for dark collection
         self.oldApplyDark = False
         self.x = 0
         self.y = 0
         self.start = time.time()
+        self.lastPublish = 0.0
+        # Time the vector variables were last published
+        self.pendingPublish = None
+        self.trailingTimer = None
+        # Latest frame not published yet, and the timer publishing it at the end of the rate window
+        self.frameQueue = collections.deque()
+        # Frames waiting for the worker thread
+        self.queueCond = threading.Condition()
+        self.processLock = threading.Lock()
+        self.worker = None
+        self.workerRun = False
+        self.framesReceived = 0
+        self.framesProcessed = 0
+        self.framesDropped = 0
+        self.tilePool = None
+        self.tileWorkers = 0
+        self.shmRing = None
+        # Shared memory ring of images for local viewers
+        self.lastHeartbeat = None
+        # Time of the last viewer heartbeat
+        self.latency = {stage: LatencyHistogram() for stage in LatencyStages}
+        self.stageTimes = dict.fromkeys(LatencyStages, 0)
+        self.lapTime = 0
+        self.frameStart = 0
+        self.lastStatsPublish = 0.0
+        self.statsTimer = None
+        # Per-stage latency histograms, the stage times of the current frame, the time of the last lap,
+        # and the time and timer of the updates of the latency and frame counter variables
         self.colormap = []
         #self.pixelBitMask = 0x0000 
         self.add(pr.LocalVariable(
@@ -64,6 +135,185 @@ class DataReceiverBase(pr.DataReceiver):
             value = 0x7fff,
         ))
         
+        self.add(pr.LocalVariable(
+            name = "ProcessInThread",
+            value = False,
+            description = "Whether frames are queued and processed in a worker thread instead of the stream thread"
+        ))
+        self.add(pr.LocalVariable(
+            name = "QueueSize",
+            value = 4,
+            localSet = self._checkQueueSizeLimit,
+            description = "Maximum number of frames waiting for the worker thread"
+        ))
+        self.add(pr.LocalVariable(
+            name = "DropPolicy",
+            value = 0,
+            enum = {0: 'DropOldest', 1: 'DropNewest'},
+            description = "Frame dropped when the worker thread queue is full"
+        ))
+        self.add(pr.LocalVariable(
+            name = "FramesReceived",
+            value = 0,
+            mode = "RO",
+            description = "Number of frames received, updated once per second"
+        ))
+        self.add(pr.LocalVariable(
+            name = "FramesProcessed",
+            value = 0,
+            mode = "RO",
+            description = "Number of frames processed, updated once per second"
+        ))
+        self.add(pr.LocalVariable(
+            name = "FramesDropped",
+            value = 0,
+            mode = "RO",
+            description = "Number of frames dropped because the worker thread queue was full, updated once per second"
+        ))
+        self.add(pr.LocalVariable(
+            name = "QueueDepth",
+            value = 0,
+            mode = "RO",
+            description = "Number of frames waiting for the worker thread, updated once per second"
+        ))
+        self.add(pr.LocalVariable(
+            name = "DescrambleWorkers",
+            value = 1,
+            localSet = self._checkDescrambleWorkersLimit,
+            description = "Number of threads descrambling the image tiles of ASICs supporting it"
+        ))
+        self.add(pr.LocalVariable(
+            name = "PublishRateHz",
+            value = 20.0,
+            description = "Maximum rate of the image and plot vectors updates, 0 to update them on every frame"
+        ))
+        self.add(pr.LocalVariable(
+            name = "SharedMemory",
+            value = False,
+            description = "Whether images go to a shared memory ring for viewers on this host instead of Data, DisplayData or CompressedData"
+        ))
+        self.add(pr.LocalVariable(
+            name = "SharedMemoryName",
+            value = '',
+            mode = "RO",
+            description = "Name of the shared memory ring of images"
+        ))
+        self.add(pr.LocalVariable(
+            name = "FrameSeq",
+            value = 0,
+            mode = "RO",
+            description = "Sequence number of the newest image in the shared memory ring"
+        ))
+        self.add(pr.LocalVariable(
+            name = "PublishMode",
+            value = 0,
+            enum = {0: 'Full', 1: 'Bin2x2', 2: 'Bin4x4', 3: 'Bin8x8', 4: 'ROI'},
+            description = "Image published: full resolution, binned or the region of interest"
+        ))
+        self.add(pr.LocalVariable(
+            name = "BinOp",
+            value = 0,
+            enum = {0: 'Mean', 1: 'Sum'},
+            description = "Whether binned pixels are the mean or the sum of the pixels they cover"
+        ))
+        self.add(pr.LocalVariable(
+            name = "RoiX",
+            value = 0,
+            localSet = self._checkRoiLimit,
+            description = "First column of the region of interest, at most the last column of the image"
+        ))
+        self.add(pr.LocalVariable(
+            name = "RoiY",
+            value = 0,
+            localSet = self._checkRoiLimit,
+            description = "First row of the region of interest, at most the last row of the image"
+        ))
+        self.add(pr.LocalVariable(
+            name = "RoiWidth",
+            value = 0,
+            localSet = self._checkRoiLimit,
+            description = "Number of columns of the region of interest, 0 up to the image edge"
+        ))
+        self.add(pr.LocalVariable(
+            name = "RoiHeight",
+            value = 0,
+            localSet = self._checkRoiLimit,
+            description = "Number of rows of the region of interest, 0 up to the image edge"
+        ))
+        self.add(pr.LocalVariable(
+            name = "RoiOriginX",
+            value = 0,
+            mode = "RO",
+            description = "First column of the published region of interest, RoiX clamped to the image"
+        ))
+        self.add(pr.LocalVariable(
+            name = "RoiOriginY",
+            value = 0,
+            mode = "RO",
+            description = "First row of the published region of interest, RoiY clamped to the image"
+        ))
+        self.add(pr.LocalVariable(
+            name = "PublishDisplayData",
+            value = False,
+            description = "Whether images are published as DisplayData, mapped to 8 bits with the contrast, instead of Data"
+        ))
+        self.add(pr.LocalVariable(
+            name = "DisplayData",
+            value = np.zeros([1,1], dtype=np.uint8),
+            mode = "RO",
+            description = "Image mapped from MinPixVal..MaxPixVal to 0..255"
+        ))
+        self.add(pr.LocalVariable(
+            name = "Compression",
+            value = 0,
+            enum = {0: 'None', 1: 'Zlib', 2: 'ShuffleDelta'},
+            description = "Whether images are published compressed as CompressedData instead of Data or DisplayData"
+        ))
+        self.add(pr.LocalVariable(
+            name = "CompressionLevel",
+            value = 1,
+            localSet = self._checkCompressionLevelLimit,
+            description = "Zlib level of the compressed images, 1 (fastest) to 9"
+        ))
+        self.add(pr.LocalVariable(
+            name = "CompressedData",
+            value = np.zeros(0, dtype=np.uint8),
+            mode = "RO",
+            description = "Compressed image bytes (uint8 array), with its shape and dtype, decoded by ePixViewer._imageCodec.decodeImage"
+        ))
+        self.add(pr.LocalVariable(
+            name = "CompressionRatio",
+            value = 0.0,
+            mode = "RO",
+            description = "Size of the last image over the size of its CompressedData"
+        ))
+        self.add(pr.LocalVariable(
+            name = "Headless",
+            value = False,
+            description = "Whether frames are only descrambled and counted, without any statistics or publishing"
+        ))
+        self.add(pr.LocalVariable(
+            name = "DemandDriven",
+            value = False,
+            description = "Whether the image, plots, noise and automatic contrast are only computed while a viewer is active"
+        ))
+        self.add(pr.LocalVariable(
+            name = "ViewerHeartbeat",
+            value = 0,
+            localSet = self._viewerHeartbeat,
+            description = "Counter incremented by the viewers every second"
+        ))
+        self.add(pr.LocalVariable(
+            name = "ViewerTimeout",
+            value = 5.0,
+            description = "Seconds without viewer (or shared memory viewer) heartbeat after which none is considered active"
+        ))
+        self.add(pr.LocalVariable(
+            name = "ViewerActive",
+            value = False,
+            mode = "RO",
+            description = "Whether a viewer heartbeat was received within ViewerTimeout"
+        ))
         self.add(pr.LocalVariable(
             name = "PixelData",
             value = [],
@@ -120,6 +370,11 @@ class DataReceiverBase(pr.DataReceiver):
             value = np.empty([1,1]),
             description = "Average of darks collected,"
         ))
+        self.add(pr.LocalVariable(
+            name = "DarkNoise",
+            value = np.empty([1,1]),
+            description = "Per-pixel noise (standard deviation) of darks collected"
+        ))
         self.add(pr.LocalVariable(
             name = "ShowDark",
             value = False,
@@ -143,7 +398,19 @@ class DataReceiverBase(pr.DataReceiver):
         self.add(pr.LocalVariable(
             name = "Bins",
             value = [],
-            description = "Vector data for histogram's bins"
+            description = "Vector data for histogram's bins, only updated when the bin range changes"
+        ))
+        self.add(pr.LocalVariable(
+            name = "HistogramStart",
+            value = 0,
+            mode = "RO",
+            description = "Lower edge of the histogram's first bin"
+        ))
+        self.add(pr.LocalVariable(
+            name = "HistogramStep",
+            value = 1,
+            mode = "RO",
+            description = "Width of the histogram's bins"
         ))
         self.add(pr.LocalVariable(
             name = "PlotHorizontal",
@@ -170,6 +437,28 @@ class DataReceiverBase(pr.DataReceiver):
             value = False,
             description = "Whether to have auto contrast or not"
         ))
+        self.add(pr.LocalVariable(
+            name = "AutoConMode",
+            value = 0,
+            enum = {0: 'MeanStd', 1: 'Percentile'},
+            description = "Automatic contrast from the mean and RMS of the window or from pixel percentiles"
+        ))
+        self.add(pr.LocalVariable(
+            name = "AutoConWindow",
+            value = 30,
+            localSet = self._checkAutoConWindowLimit,
+            description = "Number of frames automatic contrast is computed over"
+        ))
+        self.add(pr.LocalVariable(
+            name = "AutoConLowPercentile",
+            value = 1.0,
+            description = "Percentile used as minimum contrast in percentile mode"
+        ))
+        self.add(pr.LocalVariable(
+            name = "AutoConHighPercentile",
+            value = 99.0,
+            description = "Percentile used as maximum contrast in percentile mode"
+        ))
         self.add(pr.LocalVariable(
             name = "DescError",
             value = 0,
@@ -186,6 +475,18 @@ class DataReceiverBase(pr.DataReceiver):
             value = False,
             description = "Whether NoiseColormap is ready or not"
         ))
+        self.add(pr.LocalVariable(
+            name = "NoiseMode",
+            value = 0,
+            enum = {0: 'Window', 1: 'Exponential'},
+            description = "Noise colormap over a sliding window of frames or with exponential forgetting"
+        ))
+        self.add(pr.LocalVariable(
+            name = "NoiseWindow",
+            value = 1000,
+            localSet = self._checkNoiseWindowLimit,
+            description = "Frame length of the noise colormap window (effective length in exponential mode)"
+        ))
         self.add(pr.LocalVariable(
             name = "TimePlotMaxLen",
             value = 1000,
@@ -196,50 +497,420 @@ class DataReceiverBase(pr.DataReceiver):
             value = False,
             description = "Whether to reset timeplot or not"
         ))
+        self.add(pr.LocalVariable(
+            name = "ResetLatency",
+            value = False,
+            description = "Whether to reset the latency statistics or not"
+        ))
+        for stage in LatencyStages:
+            for stat in ('Mean', 'P50', 'P99'):
+                self.add(pr.LocalVariable(
+                    name = f"Latency{stage}{stat}",
+                    value = 0.0,
+                    mode = "RO",
+                    units = "us",
+                    disp = '{:.1f}',
+                    description = f"{stat} time per frame of the {stage} processing stage, updated every second"
+                ))
         maxlen = 1000
-        index = -maxlen
-        for i in range(maxlen):
-            self.TimePlotQueue.append(0)
-            self.TimePlotIndexQueue.append(index + i)
+        self.TimePlotBuffer.extend(np.zeros(maxlen))
+        self.TimePlotIndexBuffer.extend(np.arange(-maxlen, 0))
     
     def _checkNumDarReqLimit(self,value):
         if value < 1 :
             raise ValueError("Cannot be less than 1")
         pass    
+
+    def _checkQueueSizeLimit(self,value):
+        if value < 1 :
+            raise ValueError("Cannot be less than 1")
+
+    def _checkDescrambleWorkersLimit(self,value):
+        if value < 1 :
+            raise ValueError("Cannot be less than 1")
+
+    def _checkNoiseWindowLimit(self,value):
+        if value < 1 :
+            raise ValueError("Cannot be less than 1")
+
+    def _checkAutoConWindowLimit(self,value):
+        if value < 1 :
+            raise ValueError("Cannot be less than 1")
+
+    def _checkRoiLimit(self,value):
+        if value < 0 :
+            raise ValueError("Cannot be less than 0")
+
+    def _checkCompressionLevelLimit(self,value):
+        if value < 1 or value > 9 :
+            raise ValueError("Must be between 1 and 9")
+
+    def _viewerHeartbeat(self,value):
+        self.lastHeartbeat = time.monotonic()
+
+    def _viewerDemand(self):
+        # Whether the outputs only viewers look at have to be computed for this frame
+        active = self.lastHeartbeat is not None and time.monotonic() - self.lastHeartbeat < self.ViewerTimeout.get()
+        if active != self.ViewerActive.value():
+            self.ViewerActive.set(active, write = True)
+        return active or not self.DemandDriven.get()
+
+    def resetAutoContrast(self):
+        self.autoContrast = AutoContrast(self.AutoConWindow.get())
+        self.autoConMode = self.AutoConMode.get()
+
+    def resetNoiseStats(self):
+        if self.NoiseMode.get() == 1:
+            self.noiseStats = ExponentialPixelStats(self.NoiseWindow.get())
+        else:
+            self.noiseStats = WindowedPixelStats(self.NoiseWindow.get())
+        self.noiseMode = self.NoiseMode.get()
+        self.noiseWindow = self.NoiseWindow.get()
     
     def resetTimePlot(self):
         maxlen = self.TimePlotMaxLen.get()
-        index = -maxlen
-        for i in range(maxlen):
-            self.TimePlotQueue.append(0)
-            self.TimePlotIndexQueue.append(index + i)
+        self.TimePlotBuffer.extend(np.zeros(maxlen))
+        self.TimePlotIndexBuffer.extend(np.arange(-maxlen, 0))
         self.nextIndex = 0
-        self.Queue.clear()
-        self.NoiseQueue.clear()
+        self.histogram.reset()
+        self.noiseStats.reset()
     
     def resetTimePlotMaxLen(self):
-        self.TimePlotQueue = collections.deque(self.TimePlotQueue.copy(), maxlen = self.TimePlotMaxLen.get())
-        self.TimePlotIndexQueue = collections.deque(self.TimePlotIndexQueue.copy(), maxlen = self.TimePlotMaxLen.get())
+        self.TimePlotBuffer.resize(self.TimePlotMaxLen.get())
+        self.TimePlotIndexBuffer.resize(self.TimePlotMaxLen.get())
+
+    def _publishDue(self):
+        # Statistics are updated on every frame, but the heavy vector variables are only
+        # published at up to PublishRateHz, each time from the latest frame
+        rate = self.PublishRateHz.get()
+        now = time.monotonic()
+        if rate > 0 and now - self.lastPublish < 1.0 / rate:
+            return False
+        self.lastPublish = now
+        return True
+
+    def _reduceImage(self, img):
+        # Binned and ROI images are views or a single reduction of the frame, so remote viewers
+        # get a fraction of the full image for a fraction of the work
+        mode = self.PublishMode.get()
+        if mode in BinFactors:
+            n = BinFactors[mode]
+            rows, cols = img.shape[0] // n, img.shape[1] // n
+            blocks = img[:rows * n, :cols * n].reshape(rows, n, cols, n)
+            if self.BinOp.get() == 1:
+                return blocks.sum(axis=(1, 3), dtype=np.float32 if img.dtype.kind == 'f' else np.uint32)
+            return blocks.mean(axis=(1, 3), dtype=self.CorrectedPixelType)
+        if mode == 4:
+            # An origin at or beyond the edge is moved to the last column or row, so the
+            # published image is never empty when the ROI does not fit the frame
+            x, y = min(self.RoiX.get(), img.shape[1] - 1), min(self.RoiY.get(), img.shape[0] - 1)
+            width, height = self.RoiWidth.get(), self.RoiHeight.get()
+            # Viewers place the image at the origin actually used
+            if x != self.RoiOriginX.value():
+                self.RoiOriginX.set(x, write = True)
+            if y != self.RoiOriginY.value():
+                self.RoiOriginY.set(y, write = True)
+            return img[y:y + height if height else None, x:x + width if width else None]
+        return img
+
+    def _displayImage(self, img):
+        # Maps the contrast range to 0..255 in one pass of float32 arithmetic (faster than
+        # a 65536 entry lookup table gather for 16 bit images)
+        low, high = self.MinPixVal.get(), self.MaxPixVal.get()
+        scale = BinFactors.get(self.PublishMode.get(), 1)
+        if self.BinOp.get() == 1:
+            # Summed bins: the contrast is set for single pixels
+            low, high = low * scale * scale, high * scale * scale
+        high = max(high, low + 1)
+        scaled = np.subtract(img, low, dtype=np.float32)
+        scaled *= 255.0 / (high - low)
+        np.clip(scaled, 0, 255, out=scaled)
+        return scaled.astype(np.uint8)
+
+    def _publishImage(self, img):
+        img = self._reduceImage(img)
+        if self.PublishDisplayData.get():
+            img = self._displayImage(img)
+        # Viewers on this host read the images from the shared memory ring and only FrameSeq goes
+        # through the server, which sends every variable update to every client
+        if self.SharedMemory.get():
+            if self.shmRing is None or self.shmRing.shape != img.shape or self.shmRing.dtype != img.dtype:
+                if self.shmRing is not None:
+                    self.shmRing.close()
+                self.shmRing = SharedImageRing.create(f'ePixViewer{os.getpid()}_{self.name}', img.shape, img.dtype)
+                self.SharedMemoryName.set(self.shmRing.name, write = True)
+            self.FrameSeq.set(self.shmRing.write(img), write = True)
+            return
+        if self.shmRing is not None:
+            self.shmRing.close()
+            self.shmRing = None
+            self.SharedMemoryName.set('', write = True)
+        if self.Compression.get():
+            blob = encodeImage(img, self.Compression.get(), self.CompressionLevel.get())
+            self.CompressionRatio.set(img.nbytes / len(blob), write = True)
+            # Published as a uint8 array, which the server and the PyDM plugin pass through as is
+            self.CompressedData.set(np.frombuffer(blob, dtype=np.uint8), write = True)
+        elif self.PublishDisplayData.get():
+            self.DisplayData.set(img, write = True)
+        else:
+            # Views of descramble's reusable buffers (or ROI views of them) would change under the
+            # published variable with the following frames
+            self.Data.set(img.copy() if img.base is not None else img, write = True)
+
+    def _allocImageBuffers(self, shape, dtype=np.uint16, count=2):
+        # Descramblers write into a small pool of preallocated images and cycle through it,
+        # so the image handed to the variable tree is not overwritten by the next frame
+        self._imageBuffers = np.zeros((count,) + tuple(shape), dtype=dtype)
+        self._imageBufferIndex = 0
+
+    def _nextImageBuffer(self):
+        self._imageBufferIndex = (self._imageBufferIndex + 1) % len(self._imageBuffers)
+        return self._imageBuffers[self._imageBufferIndex]
+
+    def _takeTiles(self, src, index, out, axis=None):
+        # np.take(src, index, axis, out) split along the output rows in TileRows tiles, run in
+        # parallel when DescrambleWorkers > 1 (NumPy releases the GIL during the gather)
+        workers = self.DescrambleWorkers.get()
+        if workers <= 1 or self.TileRows is None or len(out) <= self.TileRows:
+            return np.take(src, index, axis=axis, out=out, mode='clip')
+        if self.tilePool is None or self.tileWorkers != workers:
+            if self.tilePool is not None:
+                self.tilePool.shutdown(wait=False)
+            self.tilePool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{self.name}Tile')
+            self.tileWorkers = workers
+        tiles = [slice(row, row + self.TileRows) for row in range(0, len(out), self.TileRows)]
+        for future in [self.tilePool.submit(np.take, src, index[tile], axis, out[tile], 'clip') for tile in tiles]:
+            future.result()
+        return out
 
     def descramble(self, frame):
         return frame
 
+    def descrambleBatch(self, payloads):
+        """Descrambles a stack of raw payloads (one frame per row) into an (N, rows, cols) image
+        stack. ASICs override this with a single vectorized call; by default every payload goes
+        through descramble. The stack is a new array, kept by the caller."""
+        return np.stack([np.array(self.descramble(PayloadFrame(payload))) for payload in payloads])
+
+    def _start(self):
+        super()._start()
+        self.workerRun = True
+        self.worker = threading.Thread(target=self._processWorker, name=f'{self.name}Worker', daemon=True)
+        self.worker.start()
+
+    def _stop(self):
+        with self.queueCond:
+            self.workerRun = False
+            self.queueCond.notify()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        if self.tilePool is not None:
+            self.tilePool.shutdown()
+            self.tilePool = None
+        with self.processLock:
+            if self.trailingTimer is not None:
+                self.trailingTimer.cancel()
+                self.trailingTimer = None
+            if self.statsTimer is not None:
+                self.statsTimer.cancel()
+                self.statsTimer = None
+            self.pendingPublish = None
+        if self.shmRing is not None:
+            self.shmRing.close()
+            self.shmRing = None
+        super()._stop()
+
+    def _processWorker(self):
+        while True:
+            with self.queueCond:
+                while self.workerRun and not self.frameQueue:
+                    self.queueCond.wait()
+                if not self.workerRun:
+                    return
+                frame = self.frameQueue.popleft()
+            try:
+                self._runFrame(frame)
+            except Exception:
+                print(f"{self.name}: frame processing failed")
+                traceback.print_exc()
+
+    def _detachFrame(self, frame):
+        # A rogue frame is only valid during process: getNumpy copies its payload once, and
+        # the copy is handed to descramble as is
+        if hasattr(frame, 'getNumpy') and not isinstance(frame, PayloadFrame):
+            return PayloadFrame(frame.getNumpy(0, frame.getPayload()))
+        return frame
+
     def process(self, frame):
-        if time.time() - self.start > 1 and self.NoiseQueue:
+        self.framesReceived += 1
+        if not self.ProcessInThread.get():
+            self._runFrame(frame)
+            return
+
+        frame = self._detachFrame(frame)
+        with self.queueCond:
+            if len(self.frameQueue) >= self.QueueSize.get():
+                self.framesDropped += 1
+                if self.DropPolicy.get() == 1:
+                    return
+                self.frameQueue.popleft()
+            self.frameQueue.append(frame)
+            self.queueCond.notify()
+
+    def _runFrame(self, frame):
+        # The worker thread may still be draining its queue when ProcessInThread is cleared
+        with self.processLock:
+            self._latencyStart()
+            self._processFrame(frame)
+            self.framesProcessed += 1
+            self._latencyEnd()
+
+    def _latencyStart(self):
+        self.stageTimes = dict.fromkeys(LatencyStages, 0)
+        self.frameStart = self.lapTime = time.perf_counter_ns()
+
+    def _lap(self, stage):
+        # Charges the time since the last lap to stage
+        now = time.perf_counter_ns()
+        self.stageTimes[stage] += now - self.lapTime
+        self.lapTime = now
+
+    def _latencyEnd(self):
+        self._lap('Publish')
+        self.stageTimes['Total'] = self.lapTime - self.frameStart
+        if self.ResetLatency.get():
+            for hist in self.latency.values():
+                hist.reset()
+            self.ResetLatency.set(False, write = True)
+        for stage, ns in self.stageTimes.items():
+            self.latency[stage].add(ns)
+        self._updateStats()
+
+    def _updateStats(self):
+        # The latency statistics and frame counters go out once per second rather than as separate
+        # variable updates to every client on every frame; a timer publishes the last ones of a burst
+        if time.monotonic() - self.lastStatsPublish >= 1.0:
+            self._publishStats()
+        elif self.statsTimer is None:
+            self.statsTimer = threading.Timer(self.lastStatsPublish + 1.0 - time.monotonic(), self._trailingStats)
+            self.statsTimer.daemon = True
+            self.statsTimer.start()
+
+    def _trailingStats(self):
+        with self.processLock:
+            self.statsTimer = None
+            self._publishStats()
+
+    def _publishStats(self):
+        self.lastStatsPublish = time.monotonic()
+        with self.root.updateGroup():
+            for stage, hist in self.latency.items():
+                self.variables[f'Latency{stage}Mean'].set(hist.mean() / 1000, write = True)
+                self.variables[f'Latency{stage}P50'].set(hist.percentile(50) / 1000, write = True)
+                self.variables[f'Latency{stage}P99'].set(hist.percentile(99) / 1000, write = True)
+            self._publishCounters()
+
+    def _queueDepth(self):
+        return len(self.frameQueue)
+
+    def _publishCounters(self):
+        self.FramesReceived.set(self.framesReceived, write = True)
+        self.FramesProcessed.set(self.framesProcessed, write = True)
+        self.FramesDropped.set(self.framesDropped, write = True)
+        self.QueueDepth.set(self._queueDepth(), write = True)
+
+    def _publishFrameImage(self, imgRaw):
+        if self.ShowDark.get():
+            self._publishImage(self.AvgDark.get())
+        elif self.NoiseColormap.get() and len(self.colormap):
+            self._publishImage(self.colormap)
+        else:
+            self._publishImage(imgRaw)
+
+    def _publishPixelData(self, imgRaw):
+        # The vectors are copies: the ring buffers and the image they are views of change with
+        # the following frames, while pyrogue serializes them later
+        if self.x < 0 or self.x >= self.length or self.y < 0 or self.y >= self.width:
+            return
+        self.PixelData.set(self.TimePlotBuffer.view().copy(), write = True)
+        self.IndexData.set(self.TimePlotIndexBuffer.view().copy(), write = True)
+
+        temp = imgRaw
+        if self.NoiseColormap.get():
+            temp = self.colormap
+        if self.PlotHorizontal.get():
+            self.Horizontal.set(temp[self.y, :].copy(), write = True)
+        else:
+            self.Horizontal.set(np.zeros(1), write = True)
+        if self.PlotVertical.get():
+            self.Vertical.set(temp[:, self.x].copy(), write = True)
+        else:
+            self.Vertical.set(np.zeros(1), write = True)
+
+    def _publishHistogram(self):
+        low, high = self.histogram.range()
+        histRange = (low - 10, high + 10)
+        if histRange != self.histRange:
+            # Bins is the histogram's x axis, set it before the counts so the plot redraws on a matching axis
+            self.HistogramStart.set(histRange[0], write = True)
+            self.Bins.set(np.arange(*histRange), write = True)
+            self.histRange = histRange
+        self.Histogram.set(self.histogram.counts(*histRange), write = True)
+
+    def _deferPublish(self, imgRaw):
+        # Keeps the latest frame skipped by the PublishRateHz gating, and makes sure it gets published
+        # at the end of the rate window if no other frame comes by then. imgRaw may be one of
+        # descramble's buffers, which are only reused by the following frames.
+        self.pendingPublish = imgRaw
+        if imgRaw is None or self.trailingTimer is not None:
+            return
+        rate = self.PublishRateHz.get()
+        delay = max(self.lastPublish + 1.0 / rate - time.monotonic(), 0.0) if rate > 0 else 0.0
+        self.trailingTimer = threading.Timer(delay, self._trailingPublish)
+        self.trailingTimer.daemon = True
+        self.trailingTimer.start()
+
+    def _trailingPublish(self):
+        with self.processLock:
+            self.trailingTimer = None
+            imgRaw, self.pendingPublish = self.pendingPublish, None
+            if imgRaw is None:
+                return
+            self.lastPublish = time.monotonic()
+            with self.root.updateGroup():
+                self._publishFrameImage(imgRaw)
+                self._publishPixelData(imgRaw)
+                self._publishHistogram()
+
+    def _processFrame(self, frame):
+        if self.Headless.get():
+            # Descramble only, for its error count, as in a DAQ with nobody looking at the images
+            self.pendingPublish = None
+            self.descramble(frame)
+            self._lap('Descramble')
+            return
+        demand = self._viewerDemand()
+        if self.NoiseMode.get() != self.noiseMode or self.NoiseWindow.get() != self.noiseWindow:
+            self.resetNoiseStats()
+        if demand and time.time() - self.start > 1 and self.noiseStats.count:
             self.start = time.time()
-            self.colormap = np.std(np.array(self.NoiseQueue), 0)
+            self.colormap = self.noiseStats.std(self.CorrectedPixelType)
+        self._lap('Noise')
         with self.root.updateGroup():
             if len(self.colormap):
                 self.NoiseColormapReady.set(True, write = True)
             imgDesc = self.descramble(frame)
-            imgView = copy(imgDesc)
-            imgRaw = copy(imgDesc)
+            if imgDesc.dtype != self.RawPixelType:
+                imgDesc = imgDesc.astype(self.RawPixelType)
+            self._lap('Descramble')
+            publish = demand and self._publishDue()
 
             if self.ResetTimePlot.get():
                 self.resetTimePlot()
                 self.ResetTimePlot.set(False, write = True)
 
-            if self.TimePlotMaxLen.get() is not self.maxlen:
+            if self.TimePlotMaxLen.get() != self.maxlen:
                 self.resetTimePlotMaxLen()
                 self.maxlen = self.TimePlotMaxLen.get()
 
@@ -247,104 +918,101 @@ class DataReceiverBase(pr.DataReceiver):
             if self.CollectDark.get():
                 if self.DarkReady.get():
                     self.AvgDark.set(np.empty([1,1]), write = True)
-                    self.DarkImg = []
+                    self.DarkNoise.set(np.empty([1,1]), write = True)
+                    self.darkStats.reset()
                     self.DarkReady.set(False, write = True)
                     self.numDarkCol = 0
-                if self.NumDarkReq.get() is not self.numDarkCol:
-                    self.DarkImg.append(imgRaw)
+                if self.NumDarkReq.get() != self.numDarkCol:
+                    self.darkStats.add(imgDesc)
                     self.numDarkCol += 1
+                    self.NumDarkCol.set(self.numDarkCol, write = True)
                 else:
-                    self.AvgDark.set(np.mean(np.array(np.intc(self.DarkImg)),axis=0), write = True)
+                    self.AvgDark.set(self.darkStats.mean(self.CorrectedPixelType), write = True)
+                    self.DarkNoise.set(self.darkStats.std(self.CorrectedPixelType), write = True)
+                    self.darkStats.reset()
                     self.DarkReady.set(True, write = True)
                     print("\n*****Dark ready*****\n")
                     self.CollectDark.set(False, write = True)
             if self.ApplyDark.get() is not self.oldApplyDark:
-                self.Queue.clear()
-                self.ImageQueue.clear()
-                self.NoiseQueue.clear()
+                self.histogram.reset()
+                self.autoContrast.reset()
+                self.noiseStats.reset()
                 self.oldApplyDark = self.ApplyDark.get()
+            if not demand:
+                # Only the dark collection goes on without viewer; automatic contrast restarts with it
+                self.autoCon = False
+                self.pendingPublish = None
+                self.Updated.set(True, write = True)
+                self._lap('Dark')
+                return
+            # imgRaw may be one of descramble's reusable buffers: it is published as is and
+            # nothing here keeps a reference to it past this frame
             if self.ApplyDark.get():
-                imgView = np.intc(imgView) - self.AvgDark.get()
-                imgRaw = np.intc(imgRaw) - self.AvgDark.get()
-            if self.ShowDark.get():
-                self.Data.set(self.AvgDark.get(), write = True)
+                imgRaw = np.subtract(imgDesc, self.AvgDark.get(), dtype=self.CorrectedPixelType)
             else:
+                imgRaw = imgDesc
+            self._lap('Dark')
+            if not self.ShowDark.get():
                 if int(self.X.get()) is not self.x or int(self.Y.get()) is not self.y:
-                    self.Queue.clear()
+                    self.histogram.reset()
 
                 # Latch X and Y
                 self.x = int(self.X.get())
                 self.y = int(self.Y.get())
 
-                if self.NoiseColormap.get():
-                    imgView = copy(self.colormap)
-
-                # Showing crosshair:
-                crossHairVal = -sys.maxsize - 1
-                # imgView (rows, columns) = imgView (y, x) = imgView (y, x) = imgView (width, length)
-                for i in range(self.x - 4, self.x + 5):
-                    if i >= 0 and i < self.length and self.x > 0 and self.x < self.length and self.y - 1 > 0 and self.y + 1 < self.width:
-                        imgView[self.y][i] = crossHairVal
-                        imgView[self.y-1][i] = crossHairVal
-                        imgView[self.y+1][i] = crossHairVal
-                for i in range(self.y - 4, self.y + 5):
-                    if i >= 0 and i < self.width and self.y > 0 and self.y < self.width and self.x - 1 > 0 and self.x + 1 < self.length:
-                        imgView[i][self.x] = crossHairVal
-                        imgView[i][self.x-1] = crossHairVal
-                        imgView[i][self.x+1] = crossHairVal
-
-                self.Data.set(imgView, write = True)
-            
-            self.NoiseQueue.append(imgRaw)
+            # The crosshair on the selected pixel is drawn by the GUI as an overlay
+            if publish:
+                self._publishFrameImage(imgRaw)
+            self._lap('Image')
+
+            self.noiseStats.add(imgRaw)
+            self._lap('Noise')
             # Setting data for timeplot and horizontal/vertical plots: imgRaw (rows, columns) = imgRaw (Y, X) = imgRaw (y, x) =  imgRaw (width, length)
             if self.x >= 0 and self.x < self.length and self.y >= 0 and self.y < self.width:
                 # Timeplot processing
                 self.PixelDataScalar.set(int(imgRaw[self.y][self.x]), write = True)
-                self.TimePlotQueue.append(int(imgRaw[self.y][self.x]))
-                self.TimePlotIndexQueue.append(self.nextIndex)
+                self.TimePlotBuffer.append(int(imgRaw[self.y][self.x]))
+                self.TimePlotIndexBuffer.append(self.nextIndex)
                 self.nextIndex += 1
-                self.PixelData.set(np.array(self.TimePlotQueue), write = True)
-                self.IndexData.set(np.array(self.TimePlotIndexQueue), write = True)
+                self.histogram.add(imgRaw[self.y][self.x])
 
-                temp = imgRaw
-                if self.NoiseColormap.get():
-                    temp = self.colormap
-                if self.PlotHorizontal.get():
-                    self.Horizontal.set(temp[self.y, :], write = True)
-                else:
-                    self.Horizontal.set(np.zeros(1), write = True)
-                if self.PlotVertical.get():
-                    self.Vertical.set(temp[:, self.x], write = True)
-                else:
-                    self.Vertical.set(np.zeros(1), write = True)
-                self.Queue.append(imgRaw[self.y][self.x])
-                self.ImageQueue.append(imgRaw)
+                if publish:
+                    self._publishPixelData(imgRaw)
+            self._lap('Pixel')
 
             # Histogram generation & automatic contrast processing:
-            array = np.array(self.Queue)
-            
-            low = np.int32(np.min(array,initial=0))
-            high = np.int32(np.max(array,initial=0))
-            binsA = np.arange(low - 10, high + 10, 1)
-            histogram, bins = np.histogram(array, bins=binsA)
-            bins = np.delete(bins, len(bins) - 1, 0)
-            self.Histogram.set(histogram, write = True)
-            self.Bins.set(bins, write = True)
+            if publish:
+                self._publishHistogram()
+            self._lap('Histogram')
             if self.AutoCon.get():
+                if not self.autoCon or self.AutoConMode.get() != self.autoConMode or self.AutoConWindow.get() != self.autoContrast.window:
+                    self.resetAutoContrast()
                 multiplier = 2
 
                 if self.ApplyDark.get():
                     multiplier = 10
+                if self.AutoConMode.get() == 1:
+                    self.autoContrast.addPercentiles(imgRaw, self.AutoConLowPercentile.get(), self.AutoConHighPercentile.get())
+                else:
+                    self.autoContrast.addMeanStd(imgRaw)
                 if self.ShowDark.get():
-                    self.MaxPixVal.set(int(self.AvgDark.get().mean() + multiplier * self.AvgDark.get().std()), write = True)
-                    self.MinPixVal.set(int(self.AvgDark.get().mean() - multiplier * self.AvgDark.get().std()), write = True)
+                    avgDark = self.AvgDark.get()
+                    mean = avgDark.mean()
+                    rms = avgDark.std()
+                    self.MaxPixVal.set(int(mean + multiplier * rms), write = True)
+                    self.MinPixVal.set(int(mean - multiplier * rms), write = True)
+                elif self.AutoConMode.get() == 1:
+                    low, high = self.autoContrast.percentiles()
+                    self.MaxPixVal.set(int(high), write = True)
+                    self.MinPixVal.set(int(low), write = True)
                 else:
-                    imgArray = np.array(self.ImageQueue)
-                    mean = imgArray.mean()
-                    rms = imgArray.std()
+                    mean, rms = self.autoContrast.meanStd()
                     self.MaxPixVal.set(int(mean + multiplier * rms), write = True)
                     self.MinPixVal.set(int(mean - multiplier * rms), write = True)
                 if self.NoiseColormap.get():
                     self.MaxPixVal.set(50, write = True)
                     self.MinPixVal.set(0, write = True)
+            self.autoCon = self.AutoCon.get()
             self.Updated.set(True, write = True)
+            self._lap('AutoContrast')
+        self._deferPublish(None if publish else imgRaw)
@@ -33,6 +33,7 @@ from copy import copy
 import subprocess
 import os
 import json
+from ePixViewer._ringBuffer import RingBuffer
 
 class EnvDataReceiver(pr.DataReceiver):
     def __init__(self, config, rawToData, clockT, payloadElementSize=4, **kwargs):
@@ -94,6 +95,17 @@ class EnvDataReceiver(pr.DataReceiver):
             value = 0.0,
         ))
 
+        self.add(pr.LocalVariable(
+            name = 'PlotMaxLen',
+            description = "Maximum number of samples kept in the plot series of each channel",
+            value = 100000,
+        ))
+
+        # Rolling series of the plots, Y and X of each channel
+        self.plotMaxLen = self.PlotMaxLen.get()
+        self.dataBuffers = [RingBuffer(self.plotMaxLen) for _ in range(len(config))]
+        self.dataXBuffers = [RingBuffer(self.plotMaxLen) for _ in range(len(config))]
+
         @self.command()
         def OpenGUI():
             subprocess.Popen(["python", os.path.dirname(os.path.abspath(__file__))+"/runLiveDisplay.py", "--dataReceiver", "rogue://0/root.{}".format(kwargs['name']), "env", "--title", "Environmental"], shell=False)
@@ -102,6 +114,8 @@ class EnvDataReceiver(pr.DataReceiver):
         def Clear():
             for i in range(len(self.configChannels)):
                 self.tickCount = 0
+                self.dataBuffers[i].clear()
+                self.dataXBuffers[i].clear()
                 self.data[i].set(np.array([]))
                 self.dataX[i].set(np.array([]))
                 self._nodes[self.configChannels[i]['ptr']].set(0)
@@ -128,23 +142,27 @@ class EnvDataReceiver(pr.DataReceiver):
                 self.tickCount += 1
 
         
+        if self.PlotMaxLen.get() != self.plotMaxLen:
+            self.plotMaxLen = self.PlotMaxLen.get()
+            for buf in self.dataBuffers + self.dataXBuffers:
+                buf.resize(self.plotMaxLen)
+
         for i in range(len(self.configChannels)):
             newData = self.configChannels[i]['conv'](self.rawToData(int(payload[self.configChannels[i]['id']+1])))
             
-            arr = self.data[i].get()
-            arr = np.append(arr, newData)
+            self.dataBuffers[i].append(newData)
             
-            xarr = self.dataX[i].get()
-            if len(xarr) == 0:
-                xarr = np.append(xarr, 0)
+            if len(self.dataXBuffers[i]) == 0:
+                self.dataXBuffers[i].append(0)
             else:
                 if self.clockT is not None:
-                    xarr = np.append(xarr, round((float(self.tickCount)*self.clockT*16), 2))
+                    self.dataXBuffers[i].append(round((float(self.tickCount)*self.clockT*16), 2))
                 else:
-                    xarr = np.append(xarr, self.tickCount)
+                    self.dataXBuffers[i].append(self.tickCount)
                 
-            self.data[i].set(arr)
-            self.dataX[i].set(xarr)
+            # Copies, as the buffers change with the next samples
+            self.data[i].set(self.dataBuffers[i].view().copy())
+            self.dataX[i].set(self.dataXBuffers[i].view().copy())
             
             self._nodes[self.configChannels[i]['ptr']].set(round(newData,5))
             
@@ -0,0 +1,67 @@
+#-----------------------------------------------------------------------------
+# Title      : Lossless image codec for the published images
+#-----------------------------------------------------------------------------
+# Description:
+# Packs an image into a self-describing compressed blob (shape and dtype in a
+# small header) and back, so viewers can be fed compressed images
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import struct
+import zlib
+import numpy as np
+
+# Codec values of the Compression variable
+CodecZlib = 1
+CodecShuffleDelta = 2
+
+_magic = b'ePxC'
+# magic, codec, number of dimensions, length of the dtype string
+_header = struct.Struct('<4sBBB')
+
+def encodeImage(img, codec=CodecZlib, level=1):
+    """Returns img compressed as a bytes blob carrying its shape and dtype.
+
+    CodecZlib deflates the pixel bytes as they are. CodecShuffleDelta first takes the
+    difference of consecutive pixels (modulo the pixel width, so it is lossless for any
+    dtype) and groups the bytes by significance, which leaves long runs of zero high
+    bytes for deflate on smooth or dark subtracted images.
+    """
+    img = np.ascontiguousarray(img)
+    dtype = img.dtype.str.encode()
+    head = _header.pack(_magic, codec, img.ndim, len(dtype)) + dtype + struct.pack(f'<{img.ndim}I', *img.shape)
+    if codec == CodecShuffleDelta:
+        flat = img.reshape(-1).view(f'u{img.itemsize}')
+        delta = np.empty_like(flat)
+        delta[:1] = flat[:1]
+        np.subtract(flat[1:], flat[:-1], out=delta[1:])
+        data = delta.view(np.uint8).reshape(-1, img.itemsize).T.tobytes()
+    elif codec == CodecZlib:
+        data = img.data
+    else:
+        raise ValueError(f"Unknown image codec {codec}")
+    return head + zlib.compress(data, level)
+
+def decodeImage(blob):
+    """Returns the image of a blob made by encodeImage"""
+    magic, codec, ndim, dtypeLen = _header.unpack_from(blob)
+    if magic != _magic:
+        raise ValueError("Not an encoded image")
+    offset = _header.size
+    dtype = np.dtype(bytes(blob[offset:offset + dtypeLen]).decode())
+    offset += dtypeLen
+    shape = struct.unpack_from(f'<{ndim}I', blob, offset)
+    offset += 4 * ndim
+    data = zlib.decompress(blob[offset:])
+    if codec == CodecShuffleDelta:
+        delta = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T.copy().view(f'u{dtype.itemsize}').reshape(-1)
+        return np.cumsum(delta, dtype=delta.dtype).view(dtype).reshape(shape)
+    if codec == CodecZlib:
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+    raise ValueError(f"Unknown image codec {codec}")
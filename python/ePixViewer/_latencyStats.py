@@ -0,0 +1,62 @@
+#-----------------------------------------------------------------------------
+# Title      : Latency histograms for the processing stages
+#-----------------------------------------------------------------------------
+# Description:
+# Fixed size log-linear histograms of nanosecond durations, used by
+# DataReceiverBase to report the mean and percentiles of each stage of process
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+
+class LatencyHistogram(object):
+    """Histogram of durations in ns with 8 bins per octave (about 6% resolution).
+
+    Durations below 16 ns get one bin per ns; above, the bin is found from the bit
+    length of the duration, so add() is a few integer operations and the memory
+    does not depend on the number of durations added. Durations longer than about
+    4.6 hours go to the last bin.
+    """
+    SubBins = 8
+    Octaves = 40
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # A list, as incrementing one element of it is much cheaper than of an array
+        self._counts = [0] * (16 + self.SubBins * self.Octaves)
+        self.count = 0
+        self.total = 0
+
+    def add(self, ns):
+        if ns < 16:
+            index = ns if ns > 0 else 0
+        else:
+            bits = ns.bit_length()
+            index = 16 + (bits - 5) * 8 + ((ns >> (bits - 4)) & 7)
+            if index >= len(self._counts):
+                index = len(self._counts) - 1
+        self._counts[index] += 1
+        self.count += 1
+        self.total += ns
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Returns the center of the bin holding percentile q, 0 when empty"""
+        if self.count == 0:
+            return 0.0
+        rank = max(int(np.ceil(q / 100 * self.count)), 1)
+        index = int(np.searchsorted(np.cumsum(self._counts), rank))
+        if index < 16:
+            return float(index)
+        octave, sub = divmod(index - 16, self.SubBins)
+        return float((self.SubBins + sub) << (octave + 1)) + (1 << octave)
@@ -0,0 +1,260 @@
+#-----------------------------------------------------------------------------
+# Title      : Streaming per-pixel statistics for the data receivers
+#-----------------------------------------------------------------------------
+# Description:
+# Per-pixel statistics updated frame by frame in constant memory, used by
+# DataReceiverBase for the dark (pedestal) collection, the noise colormap and
+# the automatic contrast, and the histogram of the selected pixel
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+from ePixViewer._ringBuffer import RingBuffer
+
+class RunningPixelStats(object):
+    """Per-pixel mean and variance of a stream of frames.
+
+    Keeps a running sum and sum of squares in float64, taken relative to the first
+    frame so the variance does not lose precision on large pedestals. Memory is a
+    few frames whatever the number of frames added, and add() does not allocate.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._shift = None
+        self._sum = None
+        self._sumSq = None
+        self._delta = None
+
+    def add(self, img):
+        if self.count == 0:
+            self._shift = np.array(img, dtype=np.float64)
+            self._sum = np.zeros_like(self._shift)
+            self._sumSq = np.zeros_like(self._shift)
+            self._delta = np.empty_like(self._shift)
+        np.subtract(img, self._shift, out=self._delta)
+        self._sum += self._delta
+        np.multiply(self._delta, self._delta, out=self._delta)
+        self._sumSq += self._delta
+        self.count += 1
+
+    def mean(self, dtype=np.float64):
+        return (self._shift + self._sum / self.count).astype(dtype)
+
+    def variance(self, dtype=np.float64):
+        mean = self._sum / self.count
+        return np.maximum(self._sumSq / self.count - mean * mean, 0).astype(dtype)
+
+    def std(self, dtype=np.float64):
+        return np.sqrt(self.variance(dtype))
+
+class WindowedPixelStats(object):
+    """Per-pixel mean and variance over roughly the last window frames.
+
+    The window is split in blocks of window / blocks frames, each with its own
+    running sum and sum of squares; when a block is full the oldest one is
+    dropped. The statistics thus cover the last window to window + window / blocks
+    frames, in blocks + 1 frames worth of accumulators.
+    """
+    def __init__(self, window=1000, blocks=4):
+        self.window = max(int(window), 1)
+        self.blocks = max(min(int(blocks), self.window), 1)
+        self.blockLen = -(-self.window // self.blocks)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._shift = None
+        self._sum = None
+        self._sumSq = None
+        self._counts = np.zeros(self.blocks + 1, dtype=np.int64)
+        self._block = 0
+        self._delta = None
+
+    def add(self, img):
+        if self._shift is None:
+            self._shift = np.array(img, dtype=np.float64)
+            self._sum = np.zeros((self.blocks + 1,) + self._shift.shape)
+            self._sumSq = np.zeros_like(self._sum)
+            self._delta = np.empty_like(self._shift)
+        if self._counts[self._block] == self.blockLen:
+            # Start a new block, overwriting the oldest one
+            self._block = (self._block + 1) % len(self._counts)
+            self.count -= self._counts[self._block]
+            self._counts[self._block] = 0
+            self._sum[self._block] = 0
+            self._sumSq[self._block] = 0
+        np.subtract(img, self._shift, out=self._delta)
+        self._sum[self._block] += self._delta
+        np.multiply(self._delta, self._delta, out=self._delta)
+        self._sumSq[self._block] += self._delta
+        self._counts[self._block] += 1
+        self.count += 1
+
+    def mean(self, dtype=np.float64):
+        return (self._shift + self._sum.sum(0) / self.count).astype(dtype)
+
+    def variance(self, dtype=np.float64):
+        mean = self._sum.sum(0) / self.count
+        return np.maximum(self._sumSq.sum(0) / self.count - mean * mean, 0).astype(dtype)
+
+    def std(self, dtype=np.float64):
+        return np.sqrt(self.variance(dtype))
+
+class ExponentialPixelStats(object):
+    """Per-pixel exponentially weighted mean and variance.
+
+    Each frame is weighted by alpha (1 / window for an effective length of window
+    frames), older frames fading out geometrically. Until window frames have been
+    added the weights are those of a plain average, so the estimate does not start
+    biased towards the first frame.
+    """
+    def __init__(self, window=1000):
+        self.window = max(int(window), 1)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._mean = None
+        self._var = None
+        self._delta = None
+
+    def add(self, img):
+        if self.count == 0:
+            self._mean = np.array(img, dtype=np.float64)
+            self._var = np.zeros_like(self._mean)
+            self._delta = np.empty_like(self._mean)
+        else:
+            alpha = 1.0 / min(self.count + 1, self.window)
+            np.subtract(img, self._mean, out=self._delta)
+            self._mean += alpha * self._delta
+            np.multiply(self._delta, self._delta, out=self._delta)
+            self._var += alpha * self._delta
+            self._var *= 1.0 - alpha
+        self.count += 1
+
+    def mean(self, dtype=np.float64):
+        return self._mean.astype(dtype)
+
+    def variance(self, dtype=np.float64):
+        return self._var.astype(dtype)
+
+    def std(self, dtype=np.float64):
+        return np.sqrt(self.variance(dtype))
+
+class AutoContrast(object):
+    """Contrast limits from statistics over the last window frames.
+
+    Every frame is reduced to two scalars: its mean and mean square (mean/std
+    mode) or its low and high percentiles, taken with np.partition on a strided
+    subsample of at most about samples pixels (percentile mode). Running totals
+    of these scalars give the window statistics, so the cost per frame does not
+    depend on the window length. Do not mix both modes without a reset().
+    """
+    def __init__(self, window=30, samples=65536):
+        self.window = max(int(window), 1)
+        self.samples = samples
+        self.reset()
+
+    def reset(self):
+        self._values = RingBuffer(self.window, shape=(2,))
+        self._total = np.zeros(2)
+        self._adds = 0
+
+    def _push(self, first, second):
+        if len(self._values) == self.window:
+            self._total -= self._values.view()[0]
+        self._values.append((first, second))
+        self._total += (first, second)
+        self._adds += 1
+        if self._adds % self.window == 0:
+            # Re-sum the window now and then so rounding errors do not pile up
+            self._total = self._values.view().sum(0)
+
+    def addMeanStd(self, img):
+        mean = img.mean(dtype=np.float64)
+        self._push(mean, img.var(dtype=np.float64) + mean * mean)
+
+    def meanStd(self):
+        mean, meanSq = self._total / len(self._values)
+        return mean, np.sqrt(max(meanSq - mean * mean, 0))
+
+    def addPercentiles(self, img, low, high):
+        flat = np.reshape(img, -1)
+        sample = flat[::max(flat.size // self.samples, 1)]
+        kth = np.rint((sample.size - 1) * np.clip([low, high], 0, 100) / 100).astype(int)
+        self._push(*np.partition(sample, kth)[kth])
+
+    def percentiles(self):
+        return tuple(self._total / len(self._values))
+
+class RollingHistogram(object):
+    """Unit bin histogram of the last window values of a scalar stream.
+
+    Counts live in a fixed integer array covering [low, high) (values outside
+    are clipped to the edge bins) and the bin of each value is kept in a ring
+    buffer, so adding a value increments its bin and decrements the bin of the
+    value leaving the window. The occupied range is tracked as values come and go.
+    """
+    def __init__(self, window=50000, low=-65536, high=65536):
+        self.window = window
+        self.low = low
+        self._counts = np.zeros(high - low, dtype=np.int32)
+        self._bins = RingBuffer(window, dtype=np.int32)
+        self.count = 0
+        self._first = 0
+        self._last = -1
+
+    def reset(self):
+        if self.count:
+            self._counts[self._first:self._last + 1] = 0
+        self._bins.clear()
+        self.count = 0
+        self._first = 0
+        self._last = -1
+
+    def add(self, value):
+        if self.count == self.window:
+            old = self._bins.view()[0]
+            self._counts[old] -= 1
+            self.count -= 1
+            if self._counts[old] == 0 and (old == self._first or old == self._last):
+                self._shrink()
+        index = min(max(int(np.floor(value)) - self.low, 0), len(self._counts) - 1)
+        self._counts[index] += 1
+        self._bins.append(index)
+        if self.count == 0:
+            self._first = self._last = index
+        else:
+            self._first = min(self._first, index)
+            self._last = max(self._last, index)
+        self.count += 1
+
+    def _shrink(self):
+        occupied = np.flatnonzero(self._counts[self._first:self._last + 1])
+        if len(occupied):
+            self._last = self._first + occupied[-1]
+            self._first += occupied[0]
+
+    def range(self):
+        """Returns the (start, stop) values of the occupied bins, (0, 0) when empty"""
+        if self.count == 0:
+            return 0, 0
+        return self._first + self.low, self._last + self.low + 1
+
+    def counts(self, start, stop):
+        """Returns the counts of the bins from start to stop (values, stop excluded)"""
+        counts = np.zeros(stop - start, dtype=self._counts.dtype)
+        first = max(start - self.low, 0)
+        last = min(stop - self.low, len(self._counts))
+        if first < last:
+            counts[first + self.low - start:last + self.low - start] = self._counts[first:last]
+        return counts
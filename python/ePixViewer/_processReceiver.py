@@ -0,0 +1,261 @@
+#-----------------------------------------------------------------------------
+# Title      : Process-per-lane data receivers
+#-----------------------------------------------------------------------------
+# Description:
+# Runs the descramble and statistics of a data receiver in a child process, so
+# the receivers of several lanes are not serialized by the GIL. Images come back
+# through shared memory double buffers.
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import os
+import time
+import threading
+import traceback
+import multiprocessing
+import pyrogue as pr
+import numpy as np
+from ePixViewer._dataReceiver import PayloadFrame
+from ePixViewer._sharedImageRing import SharedImageRing
+
+# Variables the parent handles itself and never exchanges with the child process
+_localVariables = {
+    'RxEnable', 'FrameCount', 'ByteCount', 'ErrorCount', 'Updated',
+    'ProcessInThread', 'QueueSize', 'DropPolicy',
+    'FramesReceived', 'FramesProcessed', 'FramesDropped', 'QueueDepth',
+}
+
+def _changed(value, last):
+    # Arrays are compared by identity: process sets a new array (or another buffer) when it updates one
+    if isinstance(value, (np.ndarray, list)) or isinstance(last, (np.ndarray, list)):
+        return value is not last
+    return value != last
+
+def _laneMain(receiverClass, kwargs, conn, ack, ringPrefix):
+    # Child process: a standalone root holding the receiver, fed by the parent through conn
+    root = pr.Root(name='LaneRoot', pollEn=False, serverPort=None)
+    receiver = receiverClass(**kwargs)
+    root.add(receiver)
+    root.start()
+
+    names = [name for name in receiver.variables if name not in _localVariables]
+    last = {name: receiver.variables[name].value() for name in names}
+    rings = {}
+    pending = False
+    sendLock = threading.Lock()
+
+    def sendResults(frameDone):
+        # Sends the variables changed since the last results, and whether they end a frame
+        nonlocal pending
+        with sendLock:
+            if pending and ack.wait(0 if frameDone else 1.0):
+                # A timer publish waits for the parent to release the images, no later frame may send them
+                ack.clear()
+                pending = False
+            changes = {}
+            images = {}
+            for name in names:
+                value = receiver.variables[name].value()
+                if not _changed(value, last[name]):
+                    continue
+                if isinstance(value, np.ndarray) and value.ndim == 2:
+                    # Double buffered: while the parent still publishes the previous images, keep
+                    # the new ones for later results
+                    if pending:
+                        continue
+                    ring = rings.get(name)
+                    if ring is None or ring.shape != value.shape or ring.dtype != value.dtype:
+                        if ring is not None:
+                            ring.close()
+                        ring = rings[name] = SharedImageRing.create(f'{ringPrefix}_{name}', value.shape, value.dtype, slots=2)
+                    images[name] = ring.write(value)
+                else:
+                    changes[name] = value
+                last[name] = value
+            pending = pending or bool(images)
+            if frameDone or changes or images:
+                conn.send((changes, images, frameDone))
+
+    def forwarded(publish):
+        def run():
+            publish()
+            sendResults(False)
+        return run
+
+    # The receiver's timers publish the last frame and statistics of a burst with no frame after them
+    receiver._trailingPublish = forwarded(receiver._trailingPublish)
+    receiver._trailingStats = forwarded(receiver._trailingStats)
+    try:
+        while True:
+            msg, arg, layout = conn.recv()
+            if msg == 'stop':
+                break
+
+            for name, value in arg.items():
+                receiver.variables[name].set(value)
+                last[name] = value
+            payload = conn.recv_bytes()
+            if layout is None:
+                frame = PayloadFrame(np.frombuffer(payload, dtype=np.uint8))
+            else:
+                frame = np.frombuffer(payload, dtype=layout[1]).reshape(layout[0])
+            try:
+                receiver.process(frame)
+            except Exception:
+                traceback.print_exc()
+            sendResults(True)
+    except (EOFError, OSError):
+        pass
+    finally:
+        # Stops the receiver's timers before their rings go away
+        root.stop()
+        for ring in rings.values():
+            ring.close()
+
+class DataReceiverProcess(object):
+    """Mixin moving the frame processing of a DataReceiverBase subclass to a child process.
+
+    The receiver stays in the root with all its variables. process() forwards the raw
+    payload of a rogue frame (or the array given to process, as is) and the control
+    variables changed since the last frame to the child, which runs the same receiver
+    class in a root of its own. The child sends back the variables its processing
+    changed, the images through shared memory double buffers, which the parent copies
+    out before publishing them. At most QueueSize frames are in flight, further frames
+    are dropped.
+
+    Use processDataReceiver(cls) to build the class for a receiver class.
+    """
+    LaneClass = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.laneKwargs = kwargs
+        self.laneProc = None
+        self.laneConn = None
+        self.laneThread = None
+        self.laneSendLock = threading.Lock()
+        self.laneAck = None
+        self.laneRings = {}
+        self.laneSynced = {}
+        self.laneInFlight = 0
+
+    def _start(self):
+        super()._start()
+        ctx = multiprocessing.get_context('spawn')
+        self.laneConn, childConn = ctx.Pipe()
+        self.laneAck = ctx.Event()
+        ringPrefix = f'ePixViewer{os.getpid()}_{self.name}'
+        self.laneProc = ctx.Process(target=_laneMain, args=(self.LaneClass, self.laneKwargs, childConn, self.laneAck, ringPrefix), name=f'{self.name}Lane', daemon=True)
+        self.laneProc.start()
+        childConn.close()
+        self.laneInFlight = 0
+        self.laneCountLock = threading.Lock()
+        self.laneThread = threading.Thread(target=self._laneResults, name=f'{self.name}LaneResults', daemon=True)
+        self.laneThread.start()
+
+    def _stop(self):
+        if self.laneProc is not None:
+            try:
+                with self.laneSendLock:
+                    self.laneConn.send(('stop', None, None))
+            except OSError:
+                pass
+            self.laneProc.join(5)
+            if self.laneProc.is_alive():
+                self.laneProc.terminate()
+            self.laneThread.join()
+            self.laneConn.close()
+            self.laneProc = None
+        for ring in self.laneRings.values():
+            ring.close()
+        self.laneRings = {}
+        super()._stop()
+
+    def _laneControlChanges(self):
+        # Scalar control variables changed in the parent (by the user or a GUI) since the last frame
+        changes = {}
+        for name, var in self.variables.items():
+            if name in _localVariables:
+                continue
+            value = var.value()
+            if isinstance(value, (np.ndarray, list)):
+                continue
+            if name not in self.laneSynced or self.laneSynced[name] != value:
+                changes[name] = value
+                self.laneSynced[name] = value
+        return changes
+
+    def process(self, frame):
+        self.framesReceived += 1
+        if self.laneProc is None or self.laneInFlight >= self.QueueSize.get():
+            self.framesDropped += 1
+            return
+        changes = self._laneControlChanges()
+        if hasattr(frame, 'getNumpy'):
+            payload = frame.getNumpy(0, frame.getPayload())
+            layout = None
+        else:
+            # Receivers fed with arrays (one row per quadrant, raw bytes) get them in the child as sent
+            payload = np.frombuffer(frame, dtype=np.uint8) if isinstance(frame, (bytes, bytearray)) else np.ascontiguousarray(frame)
+            layout = (payload.shape, payload.dtype.str)
+        with self.laneCountLock:
+            self.laneInFlight += 1
+        with self.laneSendLock:
+            self.laneConn.send(('frame', changes, layout))
+            self.laneConn.send_bytes(payload.reshape(-1).view(np.uint8))
+
+    def _queueDepth(self):
+        return self.laneInFlight
+
+    def _publishStats(self):
+        # The latency statistics come from the child process with the other variables
+        self.lastStatsPublish = time.monotonic()
+        with self.root.updateGroup():
+            self._publishCounters()
+
+    def _laneRing(self, name):
+        ring = self.laneRings.get(name)
+        if ring is None or not ring.valid:
+            # First image, or the child recreated the ring for a new geometry
+            if ring is not None:
+                ring.close()
+            # The child was spawned from this process and shares its resource tracker
+            ring = self.laneRings[name] = SharedImageRing.attach(f'ePixViewer{os.getpid()}_{self.name}_{name}', track = True)
+        return ring
+
+    def _laneResults(self):
+        while True:
+            try:
+                changes, images, frameDone = self.laneConn.recv()
+            except (EOFError, OSError):
+                return
+            with self.root.updateGroup():
+                for name, value in changes.items():
+                    self.variables[name].set(value, write = True)
+                    if not isinstance(value, (np.ndarray, list)):
+                        self.laneSynced[name] = value
+                for name, seq in images.items():
+                    # A copy, as pyrogue serializes the value after the ack lets the child reuse the slot
+                    img = self._laneRing(name).read(seq)
+                    if img is not None:
+                        self.variables[name].set(img, write = True)
+                if images:
+                    self.laneAck.set()
+                if frameDone:
+                    with self.laneCountLock:
+                        self.laneInFlight -= 1
+                    self.framesProcessed += 1
+                    with self.processLock:
+                        self._updateStats()
+                self.Updated.set(True, write = True)
+
+def processDataReceiver(receiverClass):
+    """Returns the process-per-lane version of a DataReceiverBase subclass, e.g.
+    processDataReceiver(ePixHrMv2.DataReceiverEpixHrMv2)(name = f"DataReceiver{lane}")"""
+    return type(receiverClass.__name__ + 'Process', (DataReceiverProcess, receiverClass), {'LaneClass': receiverClass})
@@ -0,0 +1,61 @@
+#-----------------------------------------------------------------------------
+# Title      : NumPy ring buffer for rolling series
+#-----------------------------------------------------------------------------
+# Description:
+# Fixed capacity FIFO backed by a single NumPy array, used for the rolling
+# series of the data receivers (time plot, window statistics)
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+
+class RingBuffer(object):
+    """Keeps the last capacity items (scalars, or arrays of the given shape).
+
+    Every item is written twice, at the write cursor and capacity further, so
+    the items held are always one contiguous slice of the backing array: view()
+    returns them oldest first without copying and append() never allocates.
+    A view stays valid until the next append.
+    """
+    def __init__(self, capacity, dtype=np.float64, shape=()):
+        self.capacity = max(int(capacity), 1)
+        self._buffer = np.zeros((2 * self.capacity,) + tuple(shape), dtype=dtype)
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
+
+    def append(self, value):
+        self._buffer[self._next] = value
+        self._buffer[self._next + self.capacity] = value
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._buffer.dtype)[-self.capacity:]
+        index = (self._next + np.arange(len(values))) % self.capacity
+        self._buffer[index] = values
+        self._buffer[index + self.capacity] = values
+        self._next = (self._next + len(values)) % self.capacity
+        self._size = min(self._size + len(values), self.capacity)
+
+    def view(self):
+        end = self._next + self.capacity
+        return self._buffer[end - self._size:end]
+
+    def resize(self, capacity):
+        """Changes the capacity, keeping the most recent items"""
+        items = self.view()[-max(int(capacity), 1):].copy()
+        self.__init__(capacity, self._buffer.dtype, self._buffer.shape[1:])
+        self.extend(items)
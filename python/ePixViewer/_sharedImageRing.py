@@ -0,0 +1,144 @@
+#-----------------------------------------------------------------------------
+# Title      : Shared memory ring of images
+#-----------------------------------------------------------------------------
+# Description:
+# Ring of fixed shape images in a named multiprocessing.shared_memory segment,
+# written by one process and read by any number of processes on the same host
+#-----------------------------------------------------------------------------
+# This file is part of the ePix rogue. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the ePix rogue, including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedImageRing(object):
+    """Ring of slots images in a named shared memory segment.
+
+    The segment starts with a header (geometry, valid flag, sequence number of
+    the newest image and of the image held by each slot) followed by the slots.
+    Image n is written to slot n % slots; its slot sequence number is cleared
+    while it is written, so a reader can tell when the image it reads has been
+    overwritten. The writer marks the ring invalid when it closes it, so readers
+    know to attach again (the writer recreates the ring when the geometry changes).
+    """
+    Magic = 0x676e6952676d4965
+    HeaderWords = 16
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.name = shm.name
+        self.owner = owner
+        header = np.ndarray((self.HeaderWords,), dtype=np.int64, buffer=shm.buf)
+        if header[0] != self.Magic:
+            raise ValueError(f"{shm.name} is not a shared image ring")
+        self._header = header
+        self.slots = int(header[2])
+        self.shape = tuple(int(n) for n in header[8:8 + header[3]])
+        self.dtype = np.dtype(int(header[4]).to_bytes(8, 'little').rstrip(b'\0').decode())
+        self._slotSeq = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=self.HeaderWords * 8)
+        self._images = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=shm.buf, offset=self._dataOffset(self.slots))
+
+    @classmethod
+    def _dataOffset(cls, slots):
+        return -(-(cls.HeaderWords + slots) * 8 // 64) * 64
+
+    @classmethod
+    def create(cls, name, shape, dtype, slots=4):
+        """Creates the ring, replacing a stale segment of the same name"""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        if len(shape) > cls.HeaderWords - 8:
+            raise ValueError("Too many image dimensions")
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        size = cls._dataOffset(slots) + slots * int(np.prod(shape)) * dtype.itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((cls.HeaderWords,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[1:5] = (1, slots, len(shape), int.from_bytes(dtype.str.encode().ljust(8, b'\0'), 'little'))
+        header[8:8 + len(shape)] = shape
+        np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=cls.HeaderWords * 8)[:] = -1
+        header[0] = cls.Magic
+        del header
+        return cls(shm, True)
+
+    @classmethod
+    def attach(cls, name, track=False):
+        """Attaches to an existing ring. Only the writer owns the segment, so by default it is
+        removed from the resource tracker, which would otherwise unlink it when this process
+        exits; a child process sharing the writer's resource tracker should pass track=True."""
+        shm = shared_memory.SharedMemory(name=name)
+        if not track:
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+        try:
+            return cls(shm, False)
+        except ValueError:
+            shm.close()
+            raise
+
+    @property
+    def valid(self):
+        return self._header is not None and self._header[1] == 1
+
+    @property
+    def sequence(self):
+        """Sequence number of the newest image, 0 before the first one"""
+        return int(self._header[5])
+
+    def write(self, img):
+        """Copies img into the next slot and returns its sequence number"""
+        seq = self.sequence + 1
+        slot = seq % self.slots
+        self._slotSeq[slot] = -1
+        self._images[slot] = img
+        self._slotSeq[slot] = seq
+        self._header[5] = seq
+        return seq
+
+    def read(self, seq=None, copy=True):
+        """Returns image seq (the newest by default), or None when it is not in the ring.
+
+        Without copy the image is a view of its slot, only valid until the slot is reused.
+        """
+        if seq is None:
+            seq = self.sequence
+        slot = seq % self.slots
+        if seq <= 0 or self._slotSeq[slot] != seq:
+            return None
+        img = self._images[slot]
+        if copy:
+            img = img.copy()
+            if self._slotSeq[slot] != seq:
+                return None
+        return img
+
+    def close(self):
+        if self._shm is None:
+            return
+        if self.owner:
+            self._header[1] = 0
+        self._header = self._slotSeq = self._images = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views of the slots are still in use; the mapping goes away with them
+            pass
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shm = None
@@ -0,0 +1,81 @@
+import os
+import numpy as np
+
+# Descramble lookup tables are cached as .npy files keyed by ASIC class and geometry, and shared in
+# memory between the receivers of a root. Bump LutCacheVersion whenever a table definition changes.
+LutCacheVersion = 1
+LutCacheDir = os.environ.get('EPIXVIEWER_LUT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'ePixViewer'))
+_lutCache = {}
+
+def cachedLut(asic, name, shape, build):
+    """Returns the lookup table name of the ASIC class for the given geometry (the table shape).
+
+    The table is looked up in memory, then in LutCacheDir, and only built with build() when
+    neither has it; a freshly built table is written back to the cache directory when possible.
+    Cached tables are read only.
+    """
+    shape = tuple(shape)
+    key = '{}_{}_{}_v{}'.format(asic.__name__, name, 'x'.join(str(n) for n in shape), LutCacheVersion)
+    if key in _lutCache:
+        return _lutCache[key]
+
+    path = os.path.join(LutCacheDir, key + '.npy')
+    try:
+        lut = np.load(path)
+    except (OSError, ValueError):
+        lut = None
+
+    if lut is None or lut.shape != shape:
+        lut = np.asarray(build())
+        try:
+            os.makedirs(LutCacheDir, exist_ok=True)
+            tmpPath = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmpPath, 'wb') as f:
+                np.save(f, lut)
+            os.replace(tmpPath, path)
+        except OSError:
+            pass
+
+    lut.flags.writeable = False
+    _lutCache[key] = lut
+    return lut
+
+def unpackUint12(packed, wordBytes, out=None):
+    """Decodes a payload of packed 12-bit samples in a single vectorized pass.
+
+    The payload is a sequence of words of wordBytes bytes, each sent byte reversed.
+    Once flipped, every group of 3 bytes holds two big-endian 12-bit samples, so a
+    word carries wordBytes * 2 / 3 samples, one per lane. The samples are written
+    to out (contiguous uint16, allocated if not given) laid out as (words, lanes)
+    and out is returned.
+    """
+    groups = np.reshape(packed, (-1, wordBytes // 3, 3))[:, ::-1, ::-1]
+    if out is None:
+        out = np.empty((groups.shape[0], groups.shape[1] * 2), dtype=np.uint16)
+    uint12 = np.reshape(out, (-1, groups.shape[1], 2))
+
+    fst = uint12[:, :, 0]
+    snd = uint12[:, :, 1]
+    np.left_shift(groups[:, :, 0], 4, out=fst, dtype=np.uint16)
+    fst |= groups[:, :, 1] >> 4
+    np.bitwise_and(groups[:, :, 1], 0x0f, out=snd, dtype=np.uint16)
+    snd <<= 8
+    snd |= groups[:, :, 2]
+    return out
+
+def bankInterleaveIndex(offset, numBanks, rows, banks=None, bankWidth=32, shiftCols=(30, 31)):
+    """Builds the flat gather index of an ePixHr bank interleaved payload.
+
+    Starting at word offset, the payload cycles through numBanks ADC banks one
+    word at a time. Each bank holds a (rows, bankWidth) block, and the blocks
+    of the requested banks (all of them by default) are placed side by side.
+    The columns in shiftCols are read one row up to undo the hardware row
+    shift (the first row stays unchanged).
+    """
+    if banks is None:
+        banks = numBanks
+    row = np.arange(rows)[:, None]
+    col = np.arange(bankWidth)[None, :]
+    srcRow = np.where(np.isin(col, shiftCols) & (row > 0), row - 1, row)
+    bankIndex = (srcRow * bankWidth + col) * numBanks
+    return offset + np.concatenate([bankIndex + bank for bank in range(banks)], 1)
@@ -27,3 +27,12 @@ class DataReceiverAdc32x32(DataReceiverBase):
         else:
             imgDesc = np.zeros((32,64), dtype='uint16')
         return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, 2, bytes) uint8, one row per quadrant as for descramble
+        if (payloads.shape[1]==2):
+            quadrants = payloads[:,:,4:].view(np.uint16).reshape(len(payloads),2,32,32)
+            imgDesc = quadrants.transpose(0,2,1,3).reshape(len(payloads),32,64)
+        else:
+            imgDesc = np.zeros((len(payloads),32,64), dtype='uint16')
+        return imgDesc
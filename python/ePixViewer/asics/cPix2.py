@@ -28,4 +28,13 @@ class DataReceiverCpix2(DataReceiverBase):
             imgDesc = np.concatenate((imgTop, imgBot),0)
         else:
             imgDesc = np.zeros((48*2,48*2), dtype='uint16')
-        return imgDesc
\ No newline at end of file
+        return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, 4, bytes) uint8, one row per quadrant as for descramble
+        if (payloads.shape[1]==4):
+            quadrants = payloads[:,:,4:].view(np.uint16).reshape(len(payloads),2,2,48,48)
+            imgDesc = quadrants.transpose(0,1,3,2,4).reshape(len(payloads),48*2,48*2)
+        else:
+            imgDesc = np.zeros((len(payloads),48*2,48*2), dtype='uint16')
+        return imgDesc
@@ -22,3 +22,12 @@ class DataReceiverCryo64xN(DataReceiverBase):
         img2 = img[6:].reshape(samples,64)
         imgDesc = np.append(img2[:,0:64:2].transpose(), img2[:,1:64:2].transpose()).reshape(64,samples)
         return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        img = payloads.view(np.uint16)
+        samples = int((img.shape[1]-6)/64)
+        if (samples) != ((img.shape[1]-6)/64):
+            return np.zeros((len(payloads),64,64), dtype='uint16')
+        img2 = img[:, 6:].reshape(len(payloads),samples,64)
+        return np.concatenate((img2[:,:,0:64:2].transpose(0,2,1), img2[:,:,1:64:2].transpose(0,2,1)), 1)
@@ -10,6 +10,9 @@ import time
 from copy import copy
 
 class DataReceiverEpix100a(DataReceiverBase):
+    # image tiles for the parallel descramble: the top and bottom ASIC rows in halves
+    TileRows = 177
+
     def __init__(self, **kwargs):
         super().__init__(708, 768, **kwargs)
         
@@ -23,47 +26,47 @@ class DataReceiverEpix100a(DataReceiverBase):
         self.pixelDepth = 16
         self.cameraModule = "Standard ePix100a"
         self.bitMask = np.uint16(0xFFFF)
+
+        # order in which the payload superRows are stacked into the image: the top half takes the
+        # odd superRows from the bottom up, the bottom half the even superRows from the top down
+        self._rowOrder = np.concatenate((np.arange(self.sensorHeight - 1, 0, -2), np.arange(0, self.sensorHeight, 2)))
+        self._allocImageBuffers((self.sensorHeight, self.sensorWidth))
     
     def descramble(self, frame):
-        imgDesc = bytearray(frame.getPayload())
-        frame.read(imgDesc,0)
-        imgDesc = self._descrambleEPix100aImage(imgDesc)
+        rawData = frame.getNumpy(0, frame.getPayload())
+        imgDesc = self._descrambleEPix100aImage(rawData)
         
         return imgDesc
 
     def _calcImgWidth(self):
         return self._NumAsicsPerSide * self._NumAdcChPerAsic * self._NumColPerAdcCh
 
-    def _descrambleEPix100aImageAsByteArray(self, rawData):
-        """performs the ePix100a image descrambling (this is a place holder only)"""
+    def _descrambleEPix100aImage(self, rawData):
+        """performs the ePix100a image descrambling """
         
         #removes header before displying the image
-        for j in range(0,32):
-            rawData.pop(0)
-        
-        #get the first superline
-        imgBot = bytearray()
-        imgTop = bytearray()
-        for j in range(0,self.sensorHeight):
-            if (j%2):
-                imgTop.extend(rawData[((self.sensorHeight-j)*self._superRowSizeInBytes):((self.sensorHeight-j+1)*self._superRowSizeInBytes)])
-            else:
-                imgBot.extend(rawData[(j*self._superRowSizeInBytes):((j+1)*self._superRowSizeInBytes)]) 
-        imgDesc = imgTop
-        imgDesc.extend(imgBot)
+        imgSizeInBytes = self.sensorHeight * self._superRowSizeInBytes
+        rawData = rawData[32:32 + imgSizeInBytes]
+        if len(rawData) != imgSizeInBytes:
+            print("Got wrong pixel number ", len(rawData) // 2)
+            return np.zeros((self.sensorHeight, self.sensorWidth), dtype=np.uint16)
 
+        superRows = rawData.view(np.uint16).reshape(self.sensorHeight, self.sensorWidth)
+        imgDesc = self._nextImageBuffer()
+        self._takeTiles(superRows, self._rowOrder, imgDesc, axis=0)
         # returns final image
         return imgDesc
 
-    def _descrambleEPix100aImage(self, rawData):
-        """performs the ePix100a image descrambling """
-        
-        imgDescBA = self._descrambleEPix100aImageAsByteArray(rawData)
-
-        imgDesc = np.frombuffer(imgDescBA,dtype='int16')
-        if self.sensorHeight*self.sensorWidth != len(imgDesc):
-           print("Got wrong pixel number ", len(imgDesc))
-        else:
-           imgDesc = imgDesc.reshape(self.sensorHeight, self.sensorWidth)
-        # returns final image
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        imgSizeInBytes = self.sensorHeight * self._superRowSizeInBytes
+        rawData = payloads[:, 32:32 + imgSizeInBytes]
+        if rawData.shape[1] != imgSizeInBytes:
+            print("Got wrong pixel number ", rawData.shape[1] // 2)
+            return np.zeros((len(payloads), self.sensorHeight, self.sensorWidth), dtype=np.uint16)
+        superRows = rawData.view(np.uint16).reshape(len(payloads), self.sensorHeight, self.sensorWidth)
+        # A new stack, filled frame by frame: one frame of rows stays in cache during its gather
+        imgDesc = np.empty((len(payloads), self.sensorHeight, self.sensorWidth), dtype=np.uint16)
+        for frameRows, img in zip(superRows, imgDesc):
+            np.take(frameRows, self._rowOrder, axis=0, out=img, mode='clip')
         return imgDesc
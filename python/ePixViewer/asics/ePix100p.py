@@ -10,20 +10,32 @@ import time
 from copy import copy
 
 class DataReceiverEpix100p(DataReceiverBase):
+    # image tiles for the parallel descramble: the top and bottom ASIC rows in halves
+    TileRows = 177
+
     def __init__(self, **kwargs):
         super().__init__(706, 768, **kwargs)
+
+        self.sensorWidth = 768
+        self.sensorHeight = 706
+        # order in which the payload superRows are stacked into the image: superRow 0 and the odd
+        # superRows from 3 up, followed by superRow 1 and the even superRows from 2 up
+        self._rowOrder = np.concatenate(([0], np.arange(3, self.sensorHeight, 2), [1], np.arange(2, self.sensorHeight, 2)))
+        self._allocImageBuffers((self.sensorHeight, self.sensorWidth))
     
     def descramble(self, frame):
-        for j in range(0,32):
-            frame.pop(0)
-        imgBot = frame[(0*1536):(1*1536)] 
-        imgTop = frame[(1*1536):(2*1536)] 
-        for j in range(2,706):
-            if (j%2):
-                imgBot.extend(frame[(j*1536):((j+1)*1536)])
-            else:
-                imgTop.extend(frame[(j*1536):((j+1)*1536)]) 
-        imgDesc = imgBot
-        imgDesc.extend(imgTop)
-        imgDesc = np.array(imgDesc,dtype='uint8')
-        return imgDesc
\ No newline at end of file
+        rawData = frame.getNumpy(0, frame.getPayload())
+        #removes header before displying the image
+        superRows = rawData[32:32 + self.sensorHeight * self.sensorWidth * 2].view(np.uint16).reshape(self.sensorHeight, self.sensorWidth)
+        imgDesc = self._nextImageBuffer()
+        self._takeTiles(superRows, self._rowOrder, imgDesc, axis=0)
+        return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        superRows = payloads[:, 32:32 + self.sensorHeight * self.sensorWidth * 2].view(np.uint16).reshape(len(payloads), self.sensorHeight, self.sensorWidth)
+        # A new stack, filled frame by frame: one frame of rows stays in cache during its gather
+        imgDesc = np.empty((len(payloads), self.sensorHeight, self.sensorWidth), dtype=np.uint16)
+        for frameRows, img in zip(superRows, imgDesc):
+            np.take(frameRows, self._rowOrder, axis=0, out=img, mode='clip')
+        return imgDesc
@@ -2,6 +2,7 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 from ePixViewer import DataReceiverBase
+from ePixViewer.asics._descrambleTools import bankInterleaveIndex, cachedLut
 import pyrogue as pr
 import numpy as np
 import sys
@@ -12,12 +13,20 @@ from copy import copy
 
 # expecting for even number of pixels : (2 + x) x 48 / 2
 class DataReceiverEpixHr10k2M(DataReceiverBase):
+    # image tiles for the parallel descramble: blocks of 24 rows across all the banks
+    TileRows = 24
+
     def __init__(self, **kwargs):
         self.ASIC_NUM    = 4
         self.ASIC_WIDTH = 192
         self.ASIC_HEIGHT  = 144
         super().__init__(self.ASIC_WIDTH * self.ASIC_NUM, self.ASIC_HEIGHT, **kwargs)
 
+        # bank interleave and row-shift patch as a single permutation of the payload words
+        # (the image is built from the first 23 of the 24 banks)
+        self.descrambleIndex = cachedLut(type(self), 'descrambleIndex', (self.ASIC_HEIGHT, 23 * 32), lambda: bankInterleaveIndex(24, 24, self.ASIC_HEIGHT, banks = 23))
+        self._allocImageBuffers(self.descrambleIndex.shape)
+
     def descramble(self, frame):
         # Function to descramble raw frames into numpy arrays
         payload = frame.getNumpy(0, frame.getPayload()).view(np.uint16)
@@ -26,27 +35,21 @@ class DataReceiverEpixHr10k2M(DataReceiverBase):
 
         #print("{} got payload of size {} (uint16). Extracted image of size {} (uint16) {}".format(self.name, payload.shape[0], img.shape[0], img))
         if (len(payload)==110640):
-            img = payload[24:self.ASIC_HEIGHT * self.ASIC_WIDTH * self.ASIC_NUM + 24]
-
-            quadrant0 = img
-            #descramble image
-            #get data for each bank
-            adcImg = quadrant0.reshape(-1,24)
-            for i in range(0,23):
-                #reshape data into 2D array per bank
-                adcImg2 = adcImg[0:adcImg.shape[0],i].reshape(-1,32)
-                #apply row-shift patch
-                adcImg2[1:,30] = adcImg2[0:adcImg2.shape[0]-1,30]
-                adcImg2[1:,31] = adcImg2[0:adcImg2.shape[0]-1,31]
-                #concatenate bank data into a single image per asic
-                if i == 0:
-                    quadrant0sq = adcImg2
-                else:
-                    quadrant0sq = np.concatenate((quadrant0sq,adcImg2),1)
-            imgDesc = quadrant0sq
+            imgDesc = self._nextImageBuffer()
+            self._takeTiles(payload, self.descrambleIndex, imgDesc)
         else:
             print("descramble error")
             imgDesc = np.zeros((self.ASIC_HEIGHT,self.ASIC_WIDTH * self.ASIC_NUM), dtype='uint16')
             
         # returns final image
-        return imgDesc
\ No newline at end of file
+        return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        payload = payloads.view(np.uint16)
+        if (payload.shape[1]==110640):
+            imgDesc = np.take(payload, self.descrambleIndex, axis=1, mode='clip')
+        else:
+            print("descramble error")
+            imgDesc = np.zeros((len(payloads),self.ASIC_HEIGHT,self.ASIC_WIDTH * self.ASIC_NUM), dtype='uint16')
+        return imgDesc
@@ -20,4 +20,8 @@ class DataReceiverEpixHrDuo10kT(DataReceiverBase):
         quadrant0sq = quadrant0.reshape(-1,384)
         
         return quadrant0sq
-        
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        img = payloads.view(np.uint16)
+        return img[:, 0:144*384+0].reshape(len(payloads), -1, 384)
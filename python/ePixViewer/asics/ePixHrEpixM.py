@@ -24,4 +24,13 @@ class DataReceiverEpixHrEpixM(DataReceiverBase):
             return imgDesc
         img2 = img[6:].reshape(samples,64)
         imgDesc = np.append(img2[:,0:64:2].transpose(), img2[:,1:64:2].transpose()).reshape(64,samples)
-        return np.transpose(imgDesc)
\ No newline at end of file
+        return np.transpose(imgDesc)
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        img = payloads.view(np.uint16)
+        samples = int((img.shape[1]-6)/64)
+        if (samples) != ((img.shape[1]-6)/64):
+            return np.zeros((len(payloads),64,64), dtype='uint16')
+        img2 = img[:, 6:].reshape(len(payloads),samples,64)
+        return np.concatenate((img2[:,:,0:64:2], img2[:,:,1:64:2]), 2)
@@ -7,33 +7,37 @@ import numpy as np
 import sys
 from copy import copy
 from ePixViewer import DataReceiverBase
+from ePixViewer.asics._descrambleTools import cachedLut
 
 
 class DataReceiverEpixHrMv2(DataReceiverBase):
+    # image tiles for the parallel descramble: blocks of 48 rows
+    TileRows = 48
+
     def __init__(self, **kwargs):
         super().__init__(384, 192, **kwargs)
         self.framePixelRow = 192
         self.framePixelColumn = 384
+
+        # for every image pixel, the position of its word in the payload (after the 24 word header)
+        self.gatherIndex = cachedLut(type(self), 'gatherIndex', (self.framePixelRow, self.framePixelColumn), self._buildGatherIndex)
+        self._allocImageBuffers((self.framePixelRow, self.framePixelColumn))
+
+    def lookupTables(self):
+        """returns the (row, column) image position of every pixel of the raw data"""
         pixelsPerLanesRows = 48
         pixelsPerLanesColumns = 64
         numOfBanks = 24
         bankHeight = pixelsPerLanesRows
         bankWidth = pixelsPerLanesColumns
 
-        imageSize = self.framePixelColumn * self.framePixelRow
-
-        self.lookupTableCol = np.zeros(imageSize, dtype=int)
-        self.lookupTableRow = np.zeros(imageSize, dtype=int)
-
         # based on descrambling pattern described here figure out the location of the pixel based on its index in raw data
         # https://confluence.slac.stanford.edu/download/attachments/392826236/image-2023-8-9_16-6-42.png?version=1&modificationDate=1691622403000&api=v2
-        descarambledImg = np.zeros((numOfBanks, bankHeight,bankWidth), dtype=int)
-        for row in range(bankHeight) :
-            for col in range (bankWidth) : 
-                for bank in range (numOfBanks) :
-                    #                                  (even cols w/ offset       +  row offset       + increment every two cols)   * fill one pixel / bank + bank increment
-                    descarambledImg[bank, row, col] = (((col+1) % 2) * 1536       +   32 * row        + int(col / 2))               * numOfBanks            + bank
-        
+        bank = np.arange(numOfBanks)[:, None, None]
+        row = np.arange(bankHeight)[None, :, None]
+        col = np.arange(bankWidth)[None, None, :]
+        #                   (even cols w/ offset       +  row offset       + increment every two cols)   * fill one pixel / bank + bank increment
+        descarambledImg = (((col+1) % 2) * 1536       +   32 * row        + col // 2)                   * numOfBanks            + bank
 
         # reorder banks from
         # 18    19    20    21    22    23
@@ -46,54 +50,54 @@ class DataReceiverEpixHrMv2(DataReceiverBase):
         #  2     6    10    14    18    22         <= Quadrant[2] 48 x 64 x 6
         #  1     5     9    13    17    21         <= Quadrant[1] 48 x 64 x 6
         #  0     4     8    12    16    20         <= Quadrant[0] 48 x 64 x 6
-
-        quadrant = [bytearray(),bytearray(),bytearray(),bytearray()]
-        for i in range(4):
-            quadrant[i] = np.concatenate((descarambledImg[0+i],
-                                        descarambledImg[4+i],
-                                        descarambledImg[8+i],
-                                        descarambledImg[12+i],
-                                        descarambledImg[16+i],
-                                        descarambledImg[20+i]),1)
-            
-        descarambledImg = np.concatenate((quadrant[0], quadrant[1]),0)
-        descarambledImg = np.concatenate((descarambledImg, quadrant[2]),0)
-        descarambledImg = np.concatenate((descarambledImg, quadrant[3]),0)  
+        descarambledImg = descarambledImg.reshape(6, 4, bankHeight, bankWidth).transpose(1, 2, 0, 3)
+        descarambledImg = descarambledImg.reshape(self.framePixelRow, self.framePixelColumn)
 
         # Work around ASIC/firmware bug: first and last row of each bank are exchanged
-        # Create lookup table where each row points to the next
-        hardwareBugWorkAroundRowLUT = np.zeros((self.framePixelRow))
-        for index in range (self.framePixelRow) :
-            hardwareBugWorkAroundRowLUT[index] = index + 1
-        # handle bank/lane roll over cases
-        hardwareBugWorkAroundRowLUT[47] = 0 
-        hardwareBugWorkAroundRowLUT[95] = 48
-        hardwareBugWorkAroundRowLUT[143] = 96 
-        hardwareBugWorkAroundRowLUT[191] = 144
+        # Create lookup table where each row points to the next, rolling over at each bank/lane
+        rows = np.arange(self.framePixelRow)
+        hardwareBugWorkAroundRowLUT = rows - rows % bankHeight + (rows + 1) % bankHeight
 
         # reverse pixel original index to new row and column to generate lookup tables
-        for row in range (self.framePixelRow) :
-            for col in range (self.framePixelColumn):  
-                index = descarambledImg[row,col]
-                self.lookupTableRow[index] = hardwareBugWorkAroundRowLUT[row]
-                self.lookupTableCol[index] = col
+        imageSize = self.framePixelColumn * self.framePixelRow
+        lookupTableRow = np.zeros(imageSize, dtype=int)
+        lookupTableCol = np.zeros(imageSize, dtype=int)
+        lookupTableRow[descarambledImg] = hardwareBugWorkAroundRowLUT[:, None]
+        lookupTableCol[descarambledImg] = np.arange(self.framePixelColumn)[None, :]
 
         # reshape column and row lookup table
-        self.lookupTableCol = np.reshape(self.lookupTableCol, (self.framePixelRow, self.framePixelColumn))
-        self.lookupTableRow = np.reshape(self.lookupTableRow, (self.framePixelRow, self.framePixelColumn))
+        lookupTableRow = np.reshape(lookupTableRow, (self.framePixelRow, self.framePixelColumn))
+        lookupTableCol = np.reshape(lookupTableCol, (self.framePixelRow, self.framePixelColumn))
+        return lookupTableRow, lookupTableCol
+
+    def _buildGatherIndex(self):
+        # invert the lookup tables into a gather index
+        lookupTableRow, lookupTableCol = self.lookupTables()
+        gatherIndex = np.empty((self.framePixelRow, self.framePixelColumn), dtype=np.intp)
+        gatherIndex[lookupTableRow, lookupTableCol] = 24 + np.arange(gatherIndex.size).reshape(gatherIndex.shape)
+        return gatherIndex
 
     def descramble(self, frame):
-        rawData = frame.getNumpy(0, frame.getPayload()).view(np.uint16)
-        current_frame_temp = np.zeros((self.framePixelRow, self.framePixelColumn), dtype=int)
         """performs the EpixMv2 image descrambling (simply applying lookup table) """
+        rawData = frame.getNumpy(0, frame.getPayload()).view(np.uint16)
         if (len(rawData)==73752):
-            imgDesc = np.frombuffer(rawData[24:73752],dtype='uint16').reshape(192, 384)
+            imgDesc = self._nextImageBuffer()
+            self._takeTiles(rawData, self.gatherIndex, imgDesc)
         else:
             print("descramble error")
             print('rawData length {}'.format(len(rawData)))
             imgDesc = np.zeros((192,384), dtype='uint16')
 
-        
-        current_frame_temp[self.lookupTableRow, self.lookupTableCol] = imgDesc
         # returns final image
-        return np.bitwise_and(current_frame_temp, self.PixelBitMask.get())
\ No newline at end of file
+        return np.bitwise_and(imgDesc, self.PixelBitMask.get() & 0xffff, out=imgDesc)
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, bytes) uint8
+        rawData = payloads.view(np.uint16)
+        if (rawData.shape[1]==73752):
+            imgDesc = np.take(rawData, self.gatherIndex, axis=1, mode='clip')
+        else:
+            print("descramble error")
+            print('rawData length {}'.format(rawData.shape[1]))
+            imgDesc = np.zeros((len(payloads),192,384), dtype='uint16')
+        return np.bitwise_and(imgDesc, self.PixelBitMask.get() & 0xffff, out=imgDesc)
@@ -24,4 +24,13 @@ class DataReceiverEpixM32Array(DataReceiverBase):
             imgDesc = np.concatenate((imgTop, imgBot),1)
         else:
             imgDesc = np.zeros((64,64), dtype='uint16')
-        return imgDesc
\ No newline at end of file
+        return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, 2, bytes) uint8, one row per quadrant as for descramble
+        if (payloads.shape[1]==2):
+            quadrants = payloads[:,:,4:].view(np.uint16).reshape(len(payloads),2,64,32)
+            imgDesc = quadrants.transpose(0,2,1,3).reshape(len(payloads),64,64)
+        else:
+            imgDesc = np.zeros((len(payloads),64,64), dtype='uint16')
+        return imgDesc
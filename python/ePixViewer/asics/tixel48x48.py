@@ -29,4 +29,14 @@ class DataReceiverTixel48x48(DataReceiverBase):
         else:
             imgDesc = np.zeros((48*2,48*2), dtype='uint16')
         imgDesc = np.where((imgDesc & 0x1) == 1 , imgDesc, 0)
-        return imgDesc
\ No newline at end of file
+        return imgDesc
+
+    def descrambleBatch(self, payloads):
+        # payloads: (N, 4, bytes) uint8, one row per quadrant as for descramble
+        if (payloads.shape[1]==4):
+            quadrants = payloads[:,:,4:].view(np.uint16).reshape(len(payloads),2,2,48,48)
+            imgDesc = quadrants.transpose(0,1,3,2,4).reshape(len(payloads),48*2,48*2)
+        else:
+            imgDesc = np.zeros((len(payloads),48*2,48*2), dtype='uint16')
+        imgDesc = np.where((imgDesc & 0x1) == 1 , imgDesc, 0)
+        return imgDesc
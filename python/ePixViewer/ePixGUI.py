@@ -21,9 +21,17 @@
 
 import os
 import pydm
+import numpy as np
+import pyqtgraph as pg
+from qtpy.QtCore import Signal, QTimer
+from qtpy.QtGui import QTransform
+from pydm.widgets.channel import PyDMChannel
+from ePixViewer._sharedImageRing import SharedImageRing
+from ePixViewer._dataReceiver import BinFactors
+from ePixViewer._imageCodec import decodeImage
 
 def runReceiverDisplay(dataReceiver, serverList='localhost:9090', root=None,
-                   title=None,sizeX=800,sizeY=1000,maxListExpand=5,maxListSize=100):
+                   title=None,sizeX=800,sizeY=1000,maxListExpand=5,maxListSize=100,sharedMemory=False):
 
     #pyrogue.pydm.runPyDM()
 
@@ -53,6 +61,7 @@ def runReceiverDisplay(dataReceiver, serverList='localhost:9090', root=None,
     macrosA['title'] = title
     macrosA['sizeX'] = sizeX
     macrosA['sizeY'] = sizeY
+    macrosA['sharedMemory'] = sharedMemory
     app = pydm.PyDMApplication(ui_file=ui,
                                command_line_args=args,
                                macros=macrosA,
@@ -62,6 +71,8 @@ def runReceiverDisplay(dataReceiver, serverList='localhost:9090', root=None,
     app.exec()
 
 class ePixGUI(pydm.Display):
+    heartbeatSignal = Signal(int)
+
     def __init__(self, parent=None, args=None, macros=None):
         super().__init__(parent=parent, args=args, macros=macros)
         # print(f'{macros=}')
@@ -75,11 +86,125 @@ class ePixGUI(pydm.Display):
         # self.ui.pushButton.clicked.connect(self.resetTimePlot)
         self.sizeX = macros['sizeX']
         self.sizeY = macros['sizeY']
+        # Crosshair on the selected pixel, drawn over the image instead of into the pixel data
+        self.crossHair = pg.PlotCurveItem(pen=pg.mkPen('r', width=2), connect='pairs')
+        self.ui.PyDMImageView.getView().addItem(self.crossHair)
+
+        # With the viewer on the receiver's host, images are read from the receiver's shared memory
+        # ring while the receiver's SharedMemory is set, and only the frame sequence number comes
+        # through the server. Otherwise the images still come as Data.
+        self.sharedRing = None
+        self.sharedRingName = ''
+        self.sharedChannels = []
+        if macros.get('sharedMemory', False):
+            self.sharedChannels = [
+                PyDMChannel(address=f'{self._dataReceiver}.SharedMemoryName', value_slot=self.sharedMemoryNameChanged),
+                PyDMChannel(address=f'{self._dataReceiver}.FrameSeq', value_slot=self.newSharedFrame),
+            ]
+            for channel in self.sharedChannels:
+                channel.connect()
+
+        # Binned and ROI images are drawn scaled and offset, so the image keeps full resolution
+        # pixel coordinates for the cursor and the crosshair
+        self.publish = {'PublishMode': 0, 'BinOp': 0, 'RoiOriginX': 0, 'RoiOriginY': 0, 'PublishDisplayData': 0}
+        self.publishChannels = [PyDMChannel(address=f'{self._dataReceiver}.{name}', value_slot=lambda value, name=name: self.publishChanged(name, value)) for name in self.publish]
+        # 8 bit images already mapped with the contrast by the receiver
+        self.publishChannels.append(PyDMChannel(address=f'{self._dataReceiver}.DisplayData', value_slot=self.newDisplayFrame))
+        # Compressed images, decoded by decodeImage
+        self.publishChannels.append(PyDMChannel(address=f'{self._dataReceiver}.CompressedData', value_slot=self.newCompressedFrame))
+        for channel in self.publishChannels:
+            channel.connect()
+
+        # Heartbeat telling a DemandDriven receiver a viewer is looking at its outputs
+        self.heartbeat = 0
+        self.heartbeatChannel = PyDMChannel(address=f'{self._dataReceiver}.ViewerHeartbeat', value_signal=self.heartbeatSignal)
+        self.heartbeatChannel.connect()
+        self.heartbeatTimer = QTimer(self)
+        self.heartbeatTimer.timeout.connect(self.sendHeartbeat)
+        self.heartbeatTimer.start(1000)
 
     def updateDisplay(self):
-        maxContrast = int(self.ui.PyDMLineEdit_5.displayText())
-        minContrast = int(self.ui.PyDMLineEdit_4.displayText())
+        mode = self.publish['PublishMode']
+        scale = BinFactors.get(mode, 1)
+        if self.publish['PublishDisplayData']:
+            # The receiver already applied the contrast
+            maxContrast, minContrast = 255, 0
+        else:
+            maxContrast = int(self.ui.PyDMLineEdit_5.displayText())
+            minContrast = int(self.ui.PyDMLineEdit_4.displayText())
+            if scale > 1 and self.publish['BinOp'] == 1:
+                # Summed bins: the contrast is set for single pixels
+                maxContrast *= scale * scale
+                minContrast *= scale * scale
         self.ui.PyDMImageView.setColorMapLimits(minContrast, maxContrast)
+        transform = QTransform()
+        if mode == 4:
+            # The origin the receiver used, RoiX and RoiY clamped to the image
+            transform.translate(self.publish['RoiOriginX'], self.publish['RoiOriginY'])
+        transform.scale(scale, scale)
+        self.ui.PyDMImageView.getImageItem().setTransform(transform)
+        self.updateCrossHair()
+
+    def updateCrossHair(self):
+        try:
+            x = int(self.ui.PyDMLineEdit_2.displayText()) + 0.5
+            y = int(self.ui.PyDMLineEdit_6.displayText()) + 0.5
+        except ValueError:
+            self.crossHair.setData([], [])
+            return
+        # Two 9 pixel long segments centered on the pixel
+        self.crossHair.setData([x - 4.5, x + 4.5, x, x], [y, y, y - 4.5, y + 4.5])
+
+    def sendHeartbeat(self):
+        self.heartbeat = (self.heartbeat + 1) % 0x7fffffff
+        self.heartbeatSignal.emit(self.heartbeat)
+
+    def publishChanged(self, name, value):
+        try:
+            self.publish[name] = int(value)
+        except (TypeError, ValueError):
+            pass
+
+    def newDisplayFrame(self, img):
+        if self.publish['PublishDisplayData']:
+            self.ui.PyDMImageView.image_value_changed(img)
+
+    def decodeImage(self, blob):
+        # Decoder hook for CompressedData, override to use another codec
+        return decodeImage(blob)
+
+    def newCompressedFrame(self, value):
+        blob = np.asarray(value, dtype=np.uint8).tobytes()
+        if not blob:
+            return
+        try:
+            img = self.decodeImage(blob)
+        except Exception as e:
+            print(f"Cannot decode compressed image: {e}")
+            return
+        self.ui.PyDMImageView.image_value_changed(img)
+
+    def sharedMemoryNameChanged(self, name):
+        if self.sharedRing is not None:
+            self.sharedRing.close()
+            self.sharedRing = None
+        self.sharedRingName = name
+
+    def newSharedFrame(self, seq):
+        if not self.sharedRingName:
+            return
+        if self.sharedRing is None or not self.sharedRing.valid:
+            # The receiver recreates its ring when the image geometry changes
+            if self.sharedRing is not None:
+                self.sharedRing.close()
+            try:
+                self.sharedRing = SharedImageRing.attach(self.sharedRingName)
+            except (FileNotFoundError, ValueError):
+                self.sharedRing = None
+                return
+        img = self.sharedRing.read()
+        if img is not None:
+            self.ui.PyDMImageView.image_value_changed(img)
 
     # def setTimeSpan(self):
     #     self.ui.PyDMTimePlot.setTimeSpan(int(self.ui.lineEdit.text()))
@@ -104,6 +229,7 @@ class ePixGUI(pydm.Display):
         self.ui.PyDMLineEdit_2.send_value()
         self.ui.PyDMLineEdit_6.setText(y)
         self.ui.PyDMLineEdit_6.send_value()
+        self.updateCrossHair()
 
     # def resetTimePlot(self):
     #     self.ui.PyDMTimePlot.removeYChannel(self.ui.PyDMTimePlot.findCurve(
@@ -61,10 +61,14 @@ parser.add_argument('--sizeX',
                     default=800,
                     help='Columns of image')
 
+parser.add_argument('--sharedMemory',
+                    action='store_true',
+                    help='Read images from the receiver shared memory ring (viewer on the same host as the receiver)')
+
 args = parser.parse_args()
 
 if args.cmd == 'image':
-    runReceiverDisplay(dataReceiver=args.dataReceiver, serverList=args.serverList, title=args.title, sizeY=args.sizeY, sizeX=args.sizeX)
+    runReceiverDisplay(dataReceiver=args.dataReceiver, serverList=args.serverList, title=args.title, sizeY=args.sizeY, sizeX=args.sizeX, sharedMemory=args.sharedMemory)
 elif args.cmd == 'pseudoscope':
     runScopeDisplay(dataReceiver=args.dataReceiver, serverList=args.serverList)
 # Use monitor if in yout Application.py your slow adc monitor is "SlowADCCntrlAxi" from "epix-hr-core",  use env if you use "work.AdcMon.vhd"